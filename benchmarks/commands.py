@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Measure every psyml command against moto KMS and SSM mocks.
+
+A psyml file with --size parameters, half of them secrets, is generated,
+then encrypt, decrypt, export, save, diff, sync, refresh and nuke are run
+on it in that order. For each command the wall time, the number of AWS
+calls per operation and the peak memory traced by tracemalloc are
+reported, and saved as JSON with --output.
+
+With --baseline, the results are compared with a previous JSON output and
+the script exits non-zero on a regression: any AWS call count going up, or
+the time or memory going up by more than --tolerance. Times and memory
+depend on the machine, use `--compare calls` on shared CI runners.
+"""
+import argparse
+import collections
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+for variable in [
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+    "AWS_SECURITY_TOKEN",
+    "AWS_SESSION_TOKEN",
+]:
+    os.environ.setdefault(variable, "testing")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import botocore.client
+from moto import mock_kms, mock_ssm
+
+from psyml import clients, models, yamlutils
+from psyml.awsutils import clear_key_arn_cache
+from psyml.settings import PSYML_KEY_ALIAS, PSYML_KEY_REGION
+
+COMMANDS = [
+    "encrypt",
+    "decrypt",
+    "export",
+    "save",
+    "diff",
+    "sync",
+    "refresh",
+    "nuke",
+]
+METRICS = ["calls", "memory", "time"]
+
+
+def synthetic(size):
+    """Return the text of a plaintext psyml file with size parameters."""
+    return yamlutils.dump(
+        {
+            "path": "/apps/benchmark/",
+            "region": "us-east-1",
+            "kmskey": "alias/aws/ssm",
+            "tags": {"cost_center": "team17", "project": "benchmark"},
+            "parameters": [
+                {
+                    "name": f"parameter_{index}",
+                    "description": f"The description of parameter {index}.",
+                    "type": "SecureString" if index % 2 else "String",
+                    "value": f"value-{index}",
+                }
+                for index in range(size)
+            ],
+        }
+    )
+
+
+def create_psyml_key():
+    """Create a KMS key and point the psyml key alias to it."""
+    kms = clients.get_client("kms", PSYML_KEY_REGION)
+    key_id = kms.create_key(Description="psyml")["KeyMetadata"]["KeyId"]
+    try:
+        kms.update_alias(AliasName=PSYML_KEY_ALIAS, TargetKeyId=key_id)
+    except kms.exceptions.NotFoundException:
+        kms.create_alias(AliasName=PSYML_KEY_ALIAS, TargetKeyId=key_id)
+
+
+def measure(text, command, jobs):
+    """Run command on a psyml file, return its output and measurements."""
+    calls = collections.Counter()
+    # pylint: disable=protected-access
+    make_api_call = botocore.client.BaseClient._make_api_call
+
+    def counted(client, operation, params):
+        service = client.meta.service_model.service_name
+        calls[f"{service}.{operation}"] += 1
+        return make_api_call(client, operation, params)
+
+    models.DECRYPTED_VALUES.clear()
+    clear_key_arn_cache()
+    output = io.StringIO()
+    with mock.patch.object(
+        botocore.client.BaseClient, "_make_api_call", counted
+    ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        psyml = models.PSyml(io.StringIO(text), jobs=jobs, output=output)
+        getattr(psyml, command)()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return output.getvalue(), {
+        "time": round(seconds, 4),
+        "memory": peak,
+        "calls": dict(sorted(calls.items())),
+    }
+
+
+@mock_kms
+@mock_ssm
+def run(size, jobs):
+    """Run all the commands on a file with size parameters."""
+    clients.reset()
+    create_psyml_key()
+    plaintext = synthetic(size)
+    results = {}
+    encrypted, results["encrypt"] = measure(plaintext, "encrypt", jobs)
+    for command in COMMANDS[1:]:
+        if command == "refresh":
+            create_psyml_key()
+        _, results[command] = measure(encrypted, command, jobs)
+    clients.reset()
+    return results
+
+
+def regressions(results, baseline, metrics, tolerance):
+    """Yield a description of every regression from the baseline."""
+    for command, result in results.items():
+        before = baseline.get(command)
+        if before is None:
+            continue
+        if "calls" in metrics:
+            for operation, count in result["calls"].items():
+                if count > before["calls"].get(operation, 0):
+                    yield (
+                        f"{command}: {operation} calls went from "
+                        f"{before['calls'].get(operation, 0)} to {count}"
+                    )
+        for metric in ["time", "memory"]:
+            limit = before[metric] * (1 + tolerance)
+            if metric in metrics and result[metric] > limit:
+                yield (
+                    f"{command}: {metric} went from {before[metric]} "
+                    f"to {result[metric]}"
+                )
+
+
+def main():
+    """Entrypoint for the commands benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--compare", nargs="+", choices=METRICS, default=METRICS
+    )
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = run(args.size, args.jobs)
+    print(f"{'command':>8} {'time':>8} {'memory':>10} {'calls':>6}")
+    for command, result in results.items():
+        print(
+            f"{command:>8} {result['time']:>7.2f}s "
+            f"{result['memory'] / 2 ** 20:>7.1f}MiB "
+            f"{sum(result['calls'].values()):>6}"
+        )
+
+    report = {
+        "size": args.size,
+        "jobs": args.jobs,
+        "python": platform.python_version(),
+        "commands": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as fobj:
+            json.dump(report, fobj, indent=2)
+            fobj.write("\n")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="UTF-8") as fobj:
+        baseline = json.load(fobj)
+    if (baseline["size"], baseline["jobs"]) != (args.size, args.jobs):
+        print("FAIL: baseline was run with a different --size or --jobs")
+        return 1
+    found = list(
+        regressions(results, baseline["commands"], args.compare, args.tolerance)
+    )
+    for regression in found:
+        print(f"REGRESSION: {regression}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
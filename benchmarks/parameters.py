@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure how long psyml takes to validate large files, and their memory use.
+
+Synthetic psyml files with 100k parameters by default are loaded and
+validated into a PSyml, then the time spent validating the parameters and
+the memory held by the Parameter objects are reported.
+"""
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from psyml import yamlutils
+from psyml.models import Parameter, PSyml
+
+
+def synthetic(size):
+    """Return the text of a psyml file with size parameters."""
+    return yamlutils.dump(
+        {
+            "path": "/apps/benchmark/",
+            "region": "us-east-1",
+            "kmskey": "alias/benchmark",
+            "parameters": [
+                {
+                    "name": f"parameter_{index}",
+                    "description": f"The description of parameter {index}.",
+                    "type": "String",
+                    "value": f"value-{index}",
+                }
+                for index in range(size)
+            ],
+        }
+    )
+
+
+def timed(func, *args):
+    """Return the result of func and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def build(data):
+    """Return the Parameters of data."""
+    return [Parameter(param) for param in data["parameters"]]
+
+
+def parameter_memory(data):
+    """Return the bytes allocated for the Parameter objects of data."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parameters = build(data)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del parameters
+    return used
+
+
+def main():
+    """Entrypoint for the parameters benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000])
+    args = parser.parse_args()
+
+    print(
+        f"{'parameters':>10} {'file':>8} {'validate':>9} "
+        f"{'memory':>10} {'per param':>10}"
+    )
+    for size in args.sizes:
+        text = synthetic(size)
+        _, file_time = timed(PSyml, io.StringIO(text))
+        data = yamlutils.load(text)
+        _, validate_time = timed(build, data)
+        memory = parameter_memory(data)
+        print(
+            f"{size:>10} {file_time:>7.2f}s {validate_time:>8.2f}s "
+            f"{memory / 2 ** 20:>7.1f}MiB {memory / size:>9.0f}B"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure how long it takes to import the psyml cli.
+
+Runs `python -X importtime -c "import psyml.__main__"` a few times, and
+prints the median import time and the slowest modules. Exits non-zero if
+boto3/botocore get imported at startup, or if the median is above the
+budget given by --max-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN = ("boto3", "botocore")
+
+
+def import_times():
+    """Return a list of (self_us, cumulative_us, module) for one run."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import psyml.__main__"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        # Nested imports are indented after the first space.
+        times.append((int(self_us), int(cumulative_us), module[1:].rstrip()))
+    return times
+
+
+def main():
+    """Entrypoint for the startup benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=100.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.runs):
+        times = import_times()
+        # Top level psyml imports include everything they import.
+        totals.append(
+            sum(
+                cumulative
+                for _, cumulative, module in times
+                if module.startswith("psyml")
+            )
+            / 1000
+        )
+
+    print(f"psyml cli import time: {statistics.median(totals):.1f}ms")
+    print("slowest modules(self time) of the last run:")
+    for self_us, _, module in sorted(times, reverse=True)[: args.top]:
+        print(f"  {self_us / 1000:8.2f}ms {module.strip()}")
+
+    imported = {module.strip().split(".")[0] for _, _, module in times}
+    failures = [
+        f"{name} imported at startup" for name in FORBIDDEN if name in imported
+    ]
+    if statistics.median(totals) > args.max_ms:
+        failures.append(f"import time above {args.max_ms}ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare YAML parsing and emitting speed with and without libyaml.
+
+Synthetic psyml files with 1k, 10k and 50k parameters are loaded and
+dumped with the pure python PyYAML implementation and with psyml.yamlutils,
+and the outputs are checked to be identical.
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from psyml import yamlutils
+
+
+def synthetic(size):
+    """Return the data of a psyml file with size parameters."""
+    return {
+        "path": "/apps/benchmark/",
+        "region": "us-east-1",
+        "kmskey": "alias/benchmark",
+        "encrypted_with": "arn:aws:kms:us-east-1:111122223333:key/benchmark",
+        "tags": {"cost_center": "team17", "project": "benchmark"},
+        "parameters": [
+            {
+                "name": f"parameter_{index}",
+                "description": f"The description of parameter {index}.",
+                "value": base64.b64encode(os.urandom(150)).decode()
+                if index % 2
+                else f"value-{index}",
+                "type": "securestring" if index % 2 else "string",
+            }
+            for index in range(size)
+        ],
+    }
+
+
+def pure_dump(data):
+    """Dump data like psyml did before libyaml was used."""
+    return yaml.dump(data, sort_keys=False, default_flow_style=False)
+
+
+def timed(func, *args):
+    """Return the result of func and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    """Entrypoint for the yaml benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    args = parser.parse_args()
+    if yamlutils.FAST_DUMPER is None:
+        print("PyYAML is not built with libyaml, nothing to compare.")
+        return 1
+
+    print(
+        f"{'parameters':>10} {'op':>5} {'pure':>9} {'libyaml':>9} {'speedup':>8}"
+    )
+    for size in args.sizes:
+        data = synthetic(size)
+        pure_text, pure_dump_time = timed(pure_dump, data)
+        text, fast_dump_time = timed(yamlutils.dump, data)
+        if text != pure_text:
+            print(f"FAIL: output differs with {size} parameters")
+            return 1
+        _, pure_load = timed(yaml.safe_load, text)
+        _, fast_load = timed(yamlutils.load, text)
+        for operation, pure, fast in [
+            ("load", pure_load, fast_load),
+            ("dump", pure_dump_time, fast_dump_time),
+        ]:
+            print(
+                f"{size:>10} {operation:>5} {pure:>8.2f}s {fast:>8.2f}s "
+                f"{pure / fast:>7.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
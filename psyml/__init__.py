@@ -0,0 +1,7 @@
+"""Secrets manager using AWS Parameter Store."""
+# profiling records when the import started, so it goes before the rest.
+from . import profiling
+from .api import invalidate, load
+from .version import __version__
+
+__all__ = ["__version__", "invalidate", "load"]
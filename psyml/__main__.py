@@ -1,16 +1,141 @@
 #!/usr/bin/env python3
 """Cli interface for psyml."""
 import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
 
+# psyml/__init__.py imports profiling first, so its import phase covers
+# the whole package.
+from . import clients, profiling, scheduler, stats
+from .concurrency import parallel_map
 from .models import PSyml
+from .settings import PSYML_JOBS
 
 
-def parse_args():
-    """Parse commandline arguments."""
+# Arguments shared by all commands, the rest are passed to the command.
+COMMON_ARGUMENTS = {
+    "command",
+    "exec_args",
+    "file",
+    "jobs",
+    "max_tps",
+    "profile",
+    "profile_output",
+    "stats",
+    "stats_format",
+    "stream",
+}
+STATS_FORMATS = {"table": stats.format_table, "json": stats.format_json}
+YML_PATTERNS = ["*.yml", "*.yaml"]
+
+
+def positive_int(value):
+    """Argument type for options that only accept a positive integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value}")
+    return number
+
+
+def positive_float(value):
+    """Argument type for options that only accept a positive number."""
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"invalid positive number: {value}")
+    return number
+
+
+def region_list(value):
+    """Argument type for a comma separated list of regions."""
+    regions = [region.strip() for region in value.split(",") if region.strip()]
+    if not regions:
+        raise argparse.ArgumentTypeError(f"invalid region list: {value}")
+    return regions
+
+
+def expand_files(paths):
+    """
+    Return the list of psyml files given on the commandline.
+
+    Directories are expanded into the yml files in them, and glob patterns
+    are expanded into the files they match.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(
+                match
+                for pattern in YML_PATTERNS
+                for match in glob.glob(os.path.join(path, pattern))
+            )
+        elif os.path.exists(path):
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path))
+        if not matches:
+            raise argparse.ArgumentTypeError(f"can't open '{path}'")
+        files.extend(matches)
+    return files
+
+
+def add_agent_parser(subparsers):
+    """Add the `agent` command, which takes different arguments."""
+    agent = subparsers.add_parser(
+        "agent", help="serve decrypted parameters to local processes"
+    )
+    agent.add_argument(
+        "--path",
+        action="append",
+        default=[],
+        dest="paths",
+        help="also serve the parameters under a parameter store path",
+    )
+    agent.add_argument(
+        "--region", default=None, help="region of the --path parameters"
+    )
+    listen = agent.add_mutually_exclusive_group(required=True)
+    listen.add_argument("--socket", help="listen on this unix socket")
+    listen.add_argument(
+        "--port", type=positive_int, help="listen on this port of localhost"
+    )
+    agent.add_argument(
+        "--ttl",
+        type=positive_float,
+        default=None,
+        help="seconds a value is cached, default $PSYML_LOAD_CACHE_TTL",
+    )
+    agent.add_argument(
+        "file", nargs="*", help="yml files, directories or glob patterns"
+    )
+
+
+def parse_args(argv=None):
+    """
+    Parse commandline arguments.
+
+    Arguments after `--` are the command to run for `psyml run`.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    exec_args = []
+    if "--" in argv:
+        exec_args = argv[argv.index("--") + 1 :]
+        argv = argv[: argv.index("--")]
+
     parser = argparse.ArgumentParser(prog="psyml")
     subparsers = parser.add_subparsers(
         help="allowed subcommands", dest="command"
     )
+    subparsers.required = True
 
     # Adding commands
     encrypt = subparsers.add_parser(
@@ -29,16 +154,301 @@ def parse_args():
     refresh = subparsers.add_parser(
         "refresh", help="compare with items in parameter store"
     )
-    for command in [encrypt, save, nuke, decrypt, diff, refresh]:
-        command.add_argument("file", type=argparse.FileType(encoding="UTF-8"))
-    return parser.parse_args()
+    sync = subparsers.add_parser(
+        "sync", help="only write parameters that changed into parameter store"
+    )
+    run_ = subparsers.add_parser(
+        "run",
+        help="run a command with the parameters as environment variables",
+        usage="psyml run [options] file [file ...] -- command [arg ...]",
+    )
+    add_agent_parser(subparsers)
+    sync.add_argument(
+        "--delete",
+        action="store_true",
+        help="delete parameters under the path that are not in the file",
+    )
+    nuke.add_argument(
+        "--sweep",
+        action="store_true",
+        help="also remove parameters under the path that are not in the file",
+    )
+    for command in [encrypt, refresh]:
+        command.add_argument(
+            "--envelope",
+            action="store_true",
+            help="encrypt values locally with one data key for the file",
+        )
+    for command in [save, nuke]:
+        command.add_argument(
+            "--regions",
+            type=region_list,
+            help="comma separated regions to use instead of the regions in "
+            "the file",
+        )
+    for command in [save, diff, sync]:
+        command.add_argument(
+            "--state",
+            metavar="FILE",
+            help="skip reading and decrypting values unchanged since they "
+            "were last saved, and record saved values in FILE",
+        )
+    for command in [encrypt, decrypt, refresh]:
+        command.add_argument(
+            "--stream",
+            action="store_true",
+            help="process parameters one at a time, for very large files",
+        )
+    for command in [encrypt, save, nuke, decrypt, diff, refresh, sync, run_]:
+        command.add_argument(
+            "file", nargs="+", help="yml files, directories or glob patterns"
+        )
+    for command in subparsers.choices.values():
+        command.add_argument(
+            "-j",
+            "--jobs",
+            type=positive_int,
+            default=PSYML_JOBS,
+            help="number of concurrent AWS calls, for all files",
+        )
+        command.add_argument(
+            "--max-tps",
+            type=positive_float,
+            default=None,
+            help="maximum number of AWS calls per second, for all files",
+        )
+        command.add_argument(
+            "--stats",
+            action="store_true",
+            help="print statistics of the AWS calls made to stderr",
+        )
+        command.add_argument(
+            "--stats-format",
+            choices=sorted(STATS_FORMATS),
+            help="like --stats, in this format, default table",
+        )
+        command.add_argument(
+            "--profile",
+            action="store_true",
+            help="print the time spent in each phase to stderr",
+        )
+        command.add_argument(
+            "--profile-output",
+            metavar="FILE",
+            help="like --profile, and save a Chrome trace(FILE ending in "
+            ".json) or a pstats file to FILE",
+        )
+    args = parser.parse_args(argv)
+    if args.command == "run" and not exec_args:
+        parser.error("run needs a command after `--`")
+    if args.command != "run" and exec_args:
+        parser.error(f"unrecognized arguments: {' '.join(exec_args)}")
+    if args.command == "agent" and not (args.file or args.paths):
+        parser.error("agent needs files or --path")
+    args.exec_args = exec_args
+    try:
+        args.file = expand_files(args.file)
+    except argparse.ArgumentTypeError as err:
+        parser.error(str(err))
+    check_files(parser, args)
+    return args
+
+
+def check_files(parser, args):
+    """Exit with an error if options don't go with the files given."""
+    if getattr(args, "stream", False) and len(args.file) > 1:
+        parser.error("--stream only works with a single file")
+    if args.profile_output and os.path.abspath(args.profile_output) in {
+        os.path.abspath(path) for path in args.file
+    }:
+        parser.error(f"--profile-output would overwrite {args.profile_output}")
+
+
+def run(path, command, options, output=None, **kwargs):
+    """
+    Run a command on a psyml file.
+
+    kwargs are passed to PSyml, e.g. `jobs` and `stream`.
+    """
+    with open(path, encoding="UTF-8") as fobj:
+        psyml = PSyml(fobj, output=output, **kwargs)
+        with profiling.span("command"):
+            getattr(psyml, command)(**options)
+
+
+def share_jobs(jobs, files):
+    """
+    Split jobs between files processed concurrently.
+
+    Return how many files to process at once and the jobs of each file, so
+    that together they never make more than jobs AWS calls at once.
+    """
+    concurrent = max(1, min(jobs, len(files)))
+    return concurrent, max(1, jobs // concurrent)
+
+
+def environment(files, jobs):
+    """
+    Return the environment with the parameters of files added.
+
+    Files are read concurrently, a parameter in a later file wins over one
+    with the same name in an earlier file.
+    """
+    concurrent, file_jobs = share_jobs(jobs, files)
+
+    def load(path):
+        with open(path, encoding="UTF-8") as fobj:
+            return PSyml(fobj, jobs=file_jobs).environment()
+
+    env = dict(os.environ)
+    for variables in parallel_map(load, files, concurrent):
+        env.update(variables)
+    return env
+
+
+def serve(args):
+    """Run the agent until interrupted."""
+    # http.server is slow to import, only the agent needs it.
+    # pylint: disable=import-outside-toplevel
+    from .agent import Agent, make_server
+
+    agent = Agent(args.file, args.paths, args.region, args.ttl, args.jobs)
+    server = make_server(agent, args.socket, args.port)
+    agent.start()
+    print(
+        f"psyml agent: serving {len(agent.names())} parameters on "
+        f"{args.socket or f'http://127.0.0.1:{args.port}'}",
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.stop()
+        server.server_close()
+        if args.socket:
+            os.unlink(args.socket)
+
+
+def run_batch(files, command, options, jobs):
+    """
+    Run a command on many psyml files concurrently, sharing jobs.
+
+    Output of each file is printed after a yaml document marker with the
+    file name, and the result of each file is reported to stderr. Return
+    the number of files that failed.
+    """
+    concurrent, file_jobs = share_jobs(jobs, files)
+
+    def run_one(path):
+        output = io.StringIO()
+        try:
+            run(path, command, options, output, jobs=file_jobs)
+        except Exception as err:  # pylint: disable=broad-except
+            return output.getvalue(), f"failed, {type(err).__name__}: {err}"
+        return output.getvalue(), "ok"
+
+    failures = 0
+    results = parallel_map(run_one, files, concurrent)
+    for path, (output, result) in zip(files, results):
+        if output:
+            print(f"--- # {path}")
+            print(output, end="")
+        print(f"{path}: {result}", file=sys.stderr)
+        failures += result != "ok"
+    return failures
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """
+    Print the time spent in each phase of the body to stderr.
+
+    If path ends in `.json`, the spans are saved there as a Chrome trace.
+    Any other path gets the cProfile stats of the main thread.
+    """
+    profiling.enable()
+    profiler = None
+    if path and not path.endswith(".json"):
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(path)
+        elif path:
+            profiling.write_chrome_trace(path)
+        print(profiling.format_summary(profiling.summary()), file=sys.stderr)
 
 
 def main():
     """Entrypoint for psyml cli."""
+    started = time.perf_counter()
     args = parse_args()
-    psyml = PSyml(args.file)
-    getattr(psyml, args.command)()
+    if not (args.profile or args.profile_output):
+        env = run_files(args)
+    else:
+        with profiled(args.profile_output):
+            profiling.record("import", profiling.IMPORT_STARTED, started)
+            profiling.record("args", started, time.perf_counter())
+            env = run_files(args)
+
+    if args.command == "run":
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execvpe(args.exec_args[0], args.exec_args, env)
+        except OSError as err:
+            sys.exit(f"psyml run: {args.exec_args[0]}: {err.strerror}")
+
+
+def run_files(args):
+    """
+    Run the command on all the files given on the commandline.
+
+    For `psyml run`, return the environment to run the command with.
+    """
+    options = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in COMMON_ARGUMENTS
+    }
+    # Files processed concurrently share the jobs, and the writes in flight.
+    clients.configure(max_pool_connections=args.jobs)
+    scheduler.configure(args.jobs)
+    if args.max_tps is not None:
+        clients.set_rate_limit(args.max_tps)
+
+    stream = getattr(args, "stream", False)
+    try:
+        if args.command == "agent":
+            serve(args)
+            return None
+        if args.command == "run":
+            with profiling.span("command"):
+                return environment(args.file, args.jobs)
+        if len(args.file) == 1:
+            run(
+                args.file[0],
+                args.command,
+                options,
+                jobs=args.jobs,
+                stream=stream,
+            )
+        elif run_batch(args.file, args.command, options, args.jobs):
+            sys.exit(1)
+        return None
+    finally:
+        if args.stats or args.stats_format:
+            print(
+                STATS_FORMATS[args.stats_format or "table"](stats.snapshot()),
+                file=sys.stderr,
+            )
 
 
 if __name__ == "__main__":
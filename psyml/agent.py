@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+A local agent serving decrypted parameters to the processes on a host.
+
+Values are addressed by their full parameter store name, e.g.
+`/apps/superman/api_token`, over HTTP on a Unix socket or on localhost:
+
+    GET /value?name=/apps/superman/api_token   the value, as text
+    GET /names                                 all the names, as JSON
+    GET /health                                `ok`
+
+On localhost, requests must be addressed to `127.0.0.1:<port>` or
+`localhost:<port>`, so a web page can't read values through DNS rebinding.
+
+Values are cached for ttl seconds. The ones requested recently are
+refreshed in the background before they expire, and concurrent requests
+for a value that is not cached share one upstream call.
+"""
+import http.server
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+import time
+import urllib.parse
+
+from . import api
+from .cache import LRUCache
+from .concurrency import parallel_map
+from .settings import PSYML_LOAD_CACHE_TTL
+
+
+AGENT_CACHE_SIZE = 100000
+# Cached values are refreshed once they are this old, relative to the ttl.
+REFRESH_AT = 0.75
+
+
+class Agent:  # pylint: disable=too-many-instance-attributes
+    """
+    Serve the values of psyml files and parameter store paths.
+
+    files are psyml files, paths are parameter store paths in region.
+    """
+
+    def __init__(self, files=(), paths=(), region=None, ttl=None, jobs=None):
+        self.files = list(files)
+        self.paths = list(paths)
+        self.region = region
+        self.ttl = PSYML_LOAD_CACHE_TTL if ttl is None else ttl
+        self.jobs = jobs
+        self._values = LRUCache(AGENT_CACHE_SIZE, ttl=self.ttl)
+        # Full name to the time it was last fetched and last requested.
+        self._fetched = {}
+        self._requested = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return f"<Agent: {len(self.files)} files, {len(self.paths)} paths>"
+
+    def sources(self):
+        """Return the Parameters of all files and paths."""
+        return [api.load(path) for path in self.files] + [
+            api.load(path, source="ssm", region=self.region)
+            for path in self.paths
+        ]
+
+    def names(self):
+        """Return the full names of all the values served."""
+        return sorted(
+            {
+                parameters.path + name
+                for parameters in self.sources()
+                for name in parameters
+            }
+        )
+
+    def get(self, name):
+        """Return the value of a full name, raise KeyError if unknown."""
+        requested = time.monotonic()
+        value = self._values.get_or_compute(name, lambda: self._fetch(name))
+        # Only after the lookup, so unknown names are not remembered.
+        with self._lock:
+            self._requested[name] = requested
+        return value
+
+    def refresh(self):
+        """
+        Fetch again the values that will expire soon.
+
+        Only values requested since they were last fetched are refreshed,
+        the others are left to expire. Failures are reported to stderr, the
+        cached value is kept until it expires.
+        """
+        now = time.monotonic()
+        with self._lock:
+            names = [
+                name
+                for name, fetched in self._fetched.items()
+                if now - fetched >= self.ttl * REFRESH_AT
+                and self._requested.get(name, 0) >= fetched
+            ]
+
+        def refresh_one(name):
+            try:
+                self._values.put(name, self._fetch(name))
+            except Exception as err:  # pylint: disable=broad-except
+                print(
+                    f"psyml agent: failed to refresh {name}: {err}",
+                    file=sys.stderr,
+                )
+
+        parallel_map(refresh_one, names, self.jobs)
+
+    def start(self):
+        """Start refreshing values in a background thread."""
+        interval = max(1.0, self.ttl * (1 - REFRESH_AT) / 2)
+
+        def loop():
+            while not self._stopped.wait(interval):
+                self.refresh()
+
+        thread = threading.Thread(target=loop, name="psyml-refresh")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop refreshing values."""
+        self._stopped.set()
+
+    def _fetch(self, name):
+        """Read the value of a full name upstream."""
+        for parameters in self.sources():
+            relative = name[len(parameters.path) :]
+            if name.startswith(parameters.path) and relative in parameters:
+                value = parameters.fetch(relative)
+                with self._lock:
+                    self._fetched[name] = time.monotonic()
+                return value
+        raise KeyError(name)
+
+
+class AgentHandler(http.server.BaseHTTPRequestHandler):
+    """Answer HTTP requests with values from the agent of the server."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve a value, the names or the health check."""
+        url = urllib.parse.urlsplit(self.path)
+        agent = self.server.agent
+        hosts = self.server.allowed_hosts
+        if hosts is not None and self.headers.get("Host") not in hosts:
+            self._reply(403, "forbidden host")
+        elif url.path == "/health":
+            self._reply(200, "ok")
+        elif url.path == "/names":
+            self._reply(200, json.dumps(agent.names()), "application/json")
+        elif url.path == "/value":
+            name = urllib.parse.parse_qs(url.query).get("name", [""])[0]
+            try:
+                self._reply(200, agent.get(name))
+            except KeyError:
+                self._reply(404, f"unknown parameter: {name}")
+            except Exception as err:  # pylint: disable=broad-except
+                self._reply(502, f"failed to read {name}: {err}")
+        else:
+            self._reply(404, "not found")
+
+    def address_string(self):
+        """Unix sockets have no client address."""
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Only log errors."""
+
+    def _reply(self, status, body, content_type="text/plain"):
+        """Send a response."""
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class UnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    """Threaded HTTP server on a Unix socket."""
+
+    daemon_threads = True
+    agent = None
+    allowed_hosts = None
+
+
+class LocalHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Threaded HTTP server on localhost."""
+
+    daemon_threads = True
+    agent = None
+
+    @property
+    def allowed_hosts(self):
+        """The Host headers of requests addressed to this server."""
+        port = self.server_address[1]
+        return {f"127.0.0.1:{port}", f"localhost:{port}"}
+
+
+def make_server(agent, socket_path=None, port=None):
+    """
+    Return a server for agent on a Unix socket, or on localhost:port.
+
+    The socket is only readable by the current user. A socket left at
+    socket_path is replaced, anything else there is an error.
+    """
+    if socket_path is not None:
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{socket_path} is not a socket")
+            os.unlink(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(socket_path, AgentHandler)
+        finally:
+            os.umask(old_umask)
+    else:
+        server = LocalHTTPServer(("127.0.0.1", port), AgentHandler)
+    server.agent = agent
+    return server
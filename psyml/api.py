@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Python API of psyml.
+
+    import psyml
+
+    config = psyml.load("config/app.yml")
+    token = config["api_token"]
+
+Values are only decrypted when they are read, and loaded files are cached
+for PSYML_LOAD_CACHE_TTL seconds.
+"""
+import collections.abc
+import functools
+import os
+
+from .cache import LRUCache
+from .clients import get_client
+from .concurrency import parallel_map
+from .models import PSyml
+from .remote import call, describe_path
+from .settings import PSYML_LOAD_CACHE_TTL
+
+
+LOADED_CACHE_SIZE = 128
+SOURCES = ("file", "ssm")
+
+# Loaded Parameters keyed by (source, path, region).
+_LOADED = LRUCache(LOADED_CACHE_SIZE, ttl=PSYML_LOAD_CACHE_TTL)
+
+
+class Parameters(collections.abc.Mapping):
+    """
+    Decrypted values of parameters, keyed by parameter name.
+
+    A value is decrypted the first time it is read, concurrent reads of the
+    same value share one decryption. path is the parameter store path of
+    the parameters.
+    """
+
+    def __init__(self, path, loaders):
+        self.path = path
+        self._loaders = loaders
+        self._values = LRUCache(len(loaders))
+
+    def __repr__(self):
+        return f"<Parameters: {len(self)} values>"
+
+    def __getitem__(self, name):
+        loader = self._loaders[name]
+        return self._values.get_or_compute(name, loader)
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def fetch(self, name):
+        """Decrypt or read the value of name again, bypassing the cache."""
+        value = self._loaders[name]()
+        self._values.put(name, value)
+        return value
+
+    def preload(self, jobs=None):
+        """Decrypt all the values concurrently."""
+        parallel_map(self.__getitem__, list(self._loaders), jobs)
+
+
+def load(path, source="file", region=None):
+    """
+    Return the decrypted values of parameters as a read-only mapping.
+
+    If source is `file`, path is a psyml file and the keys are the names of
+    the parameters in it. If source is `ssm`, path is a parameter store path
+    in region, and the keys are the names of all the parameters under it,
+    relative to path. The result is cached until it expires, invalidate()
+    is called, or the file changes.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"source should be one of {SOURCES}, not {source}")
+    if source == "ssm":
+        path = path.rstrip("/") + "/"
+        key = (source, path, region)
+        return _LOADED.get_or_compute(key, lambda: _load_ssm(path, region))
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (source, path, region)
+    cached = _LOADED.get(key)
+    if cached is not None and cached[0] != signature:
+        _LOADED.pop(key)
+    entry = _LOADED.get_or_compute(key, lambda: (signature, _load_file(path)))
+    return entry[1]
+
+
+def invalidate(path=None, source="file", region=None):
+    """Forget a loaded path, or everything if path is not given."""
+    if path is None:
+        _LOADED.clear()
+    elif source == "ssm":
+        _LOADED.pop((source, path.rstrip("/") + "/", region))
+    else:
+        _LOADED.pop((source, os.path.abspath(path), region))
+
+
+def _load_file(path):
+    """Return the Parameters of a psyml file."""
+    with open(path, encoding="UTF-8") as fobj:
+        psyml = PSyml(fobj)
+    return Parameters(
+        psyml.path,
+        {
+            param.name: functools.partial(getattr, param, "decrypted_value")
+            for param in psyml.parameters
+        },
+    )
+
+
+def _load_ssm(path, region):
+    """Return the Parameters under a parameter store path."""
+    ssm = get_client("ssm", region)
+
+    def read(name):
+        return call(ssm.get_parameter, Name=name, WithDecryption=True)[
+            "Parameter"
+        ]["Value"]
+
+    return Parameters(
+        path,
+        {
+            name[len(path) :]: functools.partial(read, name)
+            for name in sorted(describe_path(ssm, path))
+        },
+    )
@@ -1,34 +1,270 @@
 #!/usr/bin/env python3
 """Encapsulated AWS utility functions."""
 import base64
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
 
-import boto3
+from .clients import credentials_id, get_client
+from .settings import (
+    PSYML_CACHE_DIR,
+    PSYML_KEY_ALIAS,
+    PSYML_KEY_CACHE_TTL,
+    PSYML_KEY_REGION,
+)
+from . import stats
+from .stats import THROTTLING_ERRORS
 
-from .settings import PSYML_KEY_REGION, PSYML_KEY_ALIAS
 
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 5.0
 
-_KMS = boto3.client("kms", region_name=PSYML_KEY_REGION)
+# Resolved psyml key Arns, keyed by (region, alias).
+_KEY_ARNS = {}
+_KEY_ARNS_LOCK = threading.Lock()
+KEY_CACHE_FILE = "keys.json"
 
 
+def _kms():
+    """Return the KMS client of the psyml key region."""
+    return get_client("kms", PSYML_KEY_REGION)
+
+
+def is_throttling(err):
+    """Check whether an exception means AWS throttled the call."""
+    response = getattr(err, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+
+
+def is_retryable(err):
+    """
+    Check whether an AWS call that raised err should be retried.
+
+    Clients don't retry by themselves, so this covers what botocore would
+    retry: throttling, server errors and connection problems.
+    """
+    # pylint: disable=import-outside-toplevel
+    from botocore.exceptions import ConnectionError as BotoConnectionError
+    from botocore.exceptions import HTTPClientError
+
+    if isinstance(err, (BotoConnectionError, HTTPClientError)):
+        return True
+    response = getattr(err, "response", None)
+    if not isinstance(response, dict):
+        return False
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    return is_throttling(err) or status >= 500
+
+
+def backoff(attempt):
+    """
+    Sleep before retrying a failed call.
+
+    This is a full jitter exponential backoff, so concurrent workers don't
+    retry in lockstep.
+    """
+    time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+    stats.retrying()
+
+
+def retry_on_throttling(func):
+    """
+    Retry an AWS call with jittered exponential backoff when throttled, or
+    when it failed with a transient error.
+
+    This is the only retry loop around AWS calls, botocore's own retries
+    are turned off in psyml.clients.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                if not is_retryable(err) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+            backoff(attempt)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    return wrapper
+
+
+@retry_on_throttling
 def decrypt_with_psyml(name, encrypted):
     """Decrypt encrypted text with KMS."""
-    return _KMS.decrypt(
-        CiphertextBlob=base64.b64decode(encrypted),
-        EncryptionContext={"Client": "psyml", "Name": name},
-    )["Plaintext"].decode()
+    return (
+        _kms()
+        .decrypt(
+            CiphertextBlob=base64.b64decode(encrypted),
+            EncryptionContext={"Client": "psyml", "Name": name},
+        )["Plaintext"]
+        .decode()
+    )
 
 
-def encrypt_with_psyml(name, plaintext):
-    """Encrypt plain text with KMS."""
+@retry_on_throttling
+def encrypt_with_psyml(name, plaintext, key_arn=None):
+    """
+    Encrypt plain text with KMS.
+
+    Pass in key_arn if it is already resolved, otherwise the current psyml
+    key will be used.
+    """
     return base64.b64encode(
-        _KMS.encrypt(
-            KeyId=get_psyml_key_arn(),
+        _kms().encrypt(
+            KeyId=key_arn or get_psyml_key_arn(),
             Plaintext=plaintext.encode(),
             EncryptionContext={"Client": "psyml", "Name": name},
         )["CiphertextBlob"]
     ).decode()
 
 
-def get_psyml_key_arn():
-    """Return the Arn of the psyml key."""
-    return _KMS.describe_key(KeyId=PSYML_KEY_ALIAS)["KeyMetadata"]["Arn"]
+@retry_on_throttling
+def reencrypt_with_psyml(name, encrypted, key_arn=None):
+    """
+    Re-encrypt encrypted text with KMS, without decrypting it locally.
+
+    Pass in key_arn if it is already resolved, otherwise the current psyml
+    key will be used. Text already encrypted with that key is returned as
+    it is, so the file doesn't change.
+    """
+    context = {"Client": "psyml", "Name": name}
+    response = _kms().re_encrypt(
+        CiphertextBlob=base64.b64decode(encrypted),
+        SourceEncryptionContext=context,
+        DestinationKeyId=key_arn or get_psyml_key_arn(),
+        DestinationEncryptionContext=context,
+    )
+    if response["SourceKeyId"] == response["KeyId"]:
+        return encrypted
+    return base64.b64encode(response["CiphertextBlob"]).decode()
+
+
+@retry_on_throttling
+def generate_data_key(key_arn=None):
+    """
+    Generate a data key with the psyml key.
+
+    Return the plaintext key and the base64 encoded encrypted key.
+    """
+    response = _kms().generate_data_key(
+        KeyId=key_arn or get_psyml_key_arn(),
+        KeySpec="AES_256",
+        EncryptionContext={"Client": "psyml"},
+    )
+    return (
+        response["Plaintext"],
+        base64.b64encode(response["CiphertextBlob"]).decode(),
+    )
+
+
+@retry_on_throttling
+def decrypt_data_key(encrypted):
+    """Decrypt a base64 encoded data key with KMS."""
+    return _kms().decrypt(
+        CiphertextBlob=base64.b64decode(encrypted),
+        EncryptionContext={"Client": "psyml"},
+    )["Plaintext"]
+
+
+@retry_on_throttling
+def reencrypt_data_key(encrypted, key_arn=None):
+    """Re-encrypt a base64 encoded data key with KMS."""
+    context = {"Client": "psyml"}
+    response = _kms().re_encrypt(
+        CiphertextBlob=base64.b64decode(encrypted),
+        SourceEncryptionContext=context,
+        DestinationKeyId=key_arn or get_psyml_key_arn(),
+        DestinationEncryptionContext=context,
+    )
+    return base64.b64encode(response["CiphertextBlob"]).decode()
+
+
+def get_psyml_key_arn(use_cache=True):
+    """
+    Return the Arn of the psyml key.
+
+    Resolved Arns are cached per (credentials, region, alias), as the alias
+    points to another key in every account, in this process and, when
+    PSYML_CACHE_DIR is set, on disk between runs. Entries expire after
+    PSYML_KEY_CACHE_TTL seconds, a non-positive TTL means they never expire.
+    Set use_cache to False to force a lookup, the cache is updated with
+    the result.
+    """
+    cache_key = (credentials_id(), PSYML_KEY_REGION, PSYML_KEY_ALIAS)
+    with _KEY_ARNS_LOCK:
+        if use_cache:
+            entry = _KEY_ARNS.get(cache_key) or _load_key_arn(cache_key)
+            if entry is not None and not _expired(entry):
+                _KEY_ARNS[cache_key] = entry
+                return entry["arn"]
+
+        entry = {"arn": _describe_psyml_key(), "resolved_at": time.time()}
+        _KEY_ARNS[cache_key] = entry
+        _store_key_arn(cache_key, entry)
+        return entry["arn"]
+
+
+def clear_key_arn_cache():
+    """Forget all key Arns resolved in this process."""
+    with _KEY_ARNS_LOCK:
+        _KEY_ARNS.clear()
+
+
+@retry_on_throttling
+def _describe_psyml_key():
+    """Ask KMS for the Arn of the psyml key."""
+    return _kms().describe_key(KeyId=PSYML_KEY_ALIAS)["KeyMetadata"]["Arn"]
+
+
+def _expired(entry):
+    """Check whether a cached key Arn is too old to be used."""
+    if PSYML_KEY_CACHE_TTL <= 0:
+        return False
+    return time.time() - entry["resolved_at"] > PSYML_KEY_CACHE_TTL
+
+
+def _read_key_cache():
+    """Read the on-disk key cache, return an empty dict on any problem."""
+    try:
+        path = os.path.join(PSYML_CACHE_DIR, KEY_CACHE_FILE)
+        with open(path, encoding="UTF-8") as fobj:
+            data = json.load(fobj)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _load_key_arn(cache_key):
+    """Load a key Arn from the on-disk cache."""
+    if not PSYML_CACHE_DIR:
+        return None
+    entry = _read_key_cache().get(" ".join(cache_key))
+    if not isinstance(entry, dict) or not {"arn", "resolved_at"} <= set(entry):
+        return None
+    return entry
+
+
+def _store_key_arn(cache_key, entry):
+    """Save a key Arn into the on-disk cache, failures are not fatal."""
+    if not PSYML_CACHE_DIR:
+        return
+    data = _read_key_cache()
+    data[" ".join(cache_key)] = entry
+    try:
+        os.makedirs(PSYML_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="UTF-8", dir=PSYML_CACHE_DIR, delete=False
+        ) as fobj:
+            json.dump(data, fobj)
+        os.replace(fobj.name, os.path.join(PSYML_CACHE_DIR, KEY_CACHE_FILE))
+    except OSError:
+        pass
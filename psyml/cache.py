@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""In memory caches for psyml."""
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+
+class LRUCache:
+    """
+    A thread safe, size bounded, least recently used cache.
+
+    If intern is set, equal values are stored as the same object, so a
+    value shared by many keys is only kept in memory once. If ttl is set,
+    values expire ttl seconds after they are stored.
+    """
+
+    def __init__(self, maxsize, intern=False, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._expires = {}
+        self._pending = {}
+        self._interned = {} if intern else None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._fresh(key)
+
+    def get(self, key, default=None):
+        """Return the cached value of key."""
+        with self._lock:
+            if not self._fresh(key):
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        """Cache value for key, return the value actually stored."""
+        with self._lock:
+            return self._store(key, value)
+
+    def pop(self, key):
+        """Remove key from the cache."""
+        with self._lock:
+            if key in self._data:
+                self._release(self._data.pop(key))
+                self._expires.pop(key, None)
+
+    def clear(self):
+        """Remove everything from the cache."""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            if self._interned is not None:
+                self._interned.clear()
+
+    def get_or_compute(self, key, func):
+        """
+        Return the cached value of key, call func to get it on a miss.
+
+        Concurrent misses on the same key wait for a single call of func.
+        """
+        with self._lock:
+            if self._fresh(key):
+                self._data.move_to_end(key)
+                return self._data[key]
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            value = func()
+        except BaseException as err:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            del self._pending[key]
+            value = self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value):
+        """Store a value, caller holds the lock."""
+        if self.maxsize <= 0:
+            return value
+        if key in self._data:
+            self._release(self._data.pop(key))
+        if self._interned is not None:
+            entry = self._interned.setdefault(value, [value, 0])
+            entry[1] += 1
+            value = entry[0]
+        self._data[key] = value
+        if self.ttl:
+            self._expires[key] = time.monotonic() + self.ttl
+        while len(self._data) > self.maxsize:
+            oldest, old_value = self._data.popitem(last=False)
+            self._release(old_value)
+            self._expires.pop(oldest, None)
+        return value
+
+    def _fresh(self, key):
+        """Check whether key is cached and not expired, caller holds lock."""
+        if key not in self._data:
+            return False
+        if self.ttl and self._expires[key] <= time.monotonic():
+            self._release(self._data.pop(key))
+            del self._expires[key]
+            return False
+        return True
+
+    def _release(self, value):
+        """Forget an interned value no longer used, caller holds the lock."""
+        if self._interned is None:
+            return
+        entry = self._interned[value]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._interned[value]
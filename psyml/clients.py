@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Shared boto3 clients for psyml.
+
+boto3 is only imported when the first client is created, so commands that
+don't talk to AWS don't pay for it.
+"""
+import hashlib
+import os
+import threading
+
+from .concurrency import TokenBucket
+from .settings import PSYML_JOBS, PSYML_MAX_TPS
+
+
+_CLIENTS = {}
+_SESSIONS = {}
+_LOCK = threading.Lock()
+_CONFIG = {
+    "max_pool_connections": PSYML_JOBS,
+    "rate_limiter": TokenBucket(PSYML_MAX_TPS) if PSYML_MAX_TPS else None,
+}
+
+
+def configure(max_pool_connections):
+    """
+    Set the connection pool size of the clients.
+
+    This should match the number of concurrent AWS calls. Clients created
+    with another pool size are dropped, so they are rebuilt on next use.
+    """
+    with _LOCK:
+        if _CONFIG["max_pool_connections"] != max_pool_connections:
+            _CONFIG["max_pool_connections"] = max_pool_connections
+            _CLIENTS.clear()
+
+
+def set_rate_limit(max_tps):
+    """
+    Limit the number of AWS calls per second made by all the clients.
+
+    The limit is shared by every thread and every file processed in this
+    process. A false max_tps removes the limit.
+    """
+    _CONFIG["rate_limiter"] = TokenBucket(max_tps) if max_tps else None
+
+
+def get_client(service, region=None, profile=None):
+    """
+    Return a boto3 client shared by everyone in this process.
+
+    One client is created per (service, region, credentials profile), so
+    endpoint resolution and HTTPS connections are reused for the whole run.
+    """
+    # pylint: disable=import-outside-toplevel
+    from botocore.config import Config
+
+    from .stats import instrument
+
+    profile = profile or os.environ.get("AWS_PROFILE")
+    key = (service, region, profile)
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _get_session(profile).client(
+                service,
+                region_name=region,
+                config=Config(
+                    max_pool_connections=_CONFIG["max_pool_connections"],
+                    tcp_keepalive=True,
+                    # Calls are retried by psyml, which also slows writes
+                    # down when they are throttled.
+                    retries={"total_max_attempts": 1},
+                ),
+            )
+            client.meta.events.register("before-call", _limit_rate)
+            instrument(client)
+            _CLIENTS[key] = client
+        return client
+
+
+def credentials_id(profile=None):
+    """
+    Return an id of the credentials used by the clients of a profile.
+
+    The id is a hash of the access key id, so it can be saved in caches,
+    and is empty when there are no credentials.
+    """
+    profile = profile or os.environ.get("AWS_PROFILE")
+    with _LOCK:
+        session = _get_session(profile)
+    credentials = session.get_credentials()
+    if credentials is None:
+        return ""
+    return hashlib.sha256(credentials.access_key.encode()).hexdigest()[:16]
+
+
+def reset():
+    """Drop all the clients and sessions."""
+    with _LOCK:
+        _CLIENTS.clear()
+        _SESSIONS.clear()
+
+
+def _get_session(profile):
+    """Return a boto3 session for a credentials profile, caller holds lock."""
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    if profile not in _SESSIONS:
+        _SESSIONS[profile] = boto3.session.Session(profile_name=profile)
+    return _SESSIONS[profile]
+
+
+def _limit_rate(**_):
+    """Wait for the global rate limit before every AWS call."""
+    limiter = _CONFIG["rate_limiter"]
+    if limiter is not None:
+        limiter.acquire()
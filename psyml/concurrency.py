@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Concurrency helpers for psyml."""
+
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .settings import PSYML_JOBS
+
+
+def parallel_map(func, items, jobs=None):
+    """
+    Apply func to every item using a bounded pool of worker threads.
+
+    Results are returned in the same order as items, so the output of a
+    command is stable no matter which call finishes first.
+    """
+    items = list(items)
+    jobs = PSYML_JOBS if jobs is None else jobs
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def ordered_imap(func, items, jobs=None, window=None):
+    """
+    Lazily apply func to every item using a bounded pool of worker threads.
+
+    Results are yielded in the same order as items. At most window items,
+    twice the number of jobs by default, are taken from items and kept in
+    memory at any time.
+    """
+    jobs = PSYML_JOBS if jobs is None else jobs
+    if jobs <= 1:
+        yield from (func(item) for item in items)
+        return
+    window = window or 2 * jobs
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque(
+            executor.submit(func, item)
+            for item in itertools.islice(items, window)
+        )
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for item in itertools.islice(items, 1):
+                    pending.append(executor.submit(func, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Limit how often something happens, shared by all threads.
+
+    rate tokens are added every second, and up to burst tokens can be saved
+    up for later.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, wait until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
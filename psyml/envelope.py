@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Envelope encryption for psyml files.
+
+All the secrets in a file are encrypted locally with AES-GCM using one data
+key, and only the data key is encrypted with the psyml key. So reading or
+writing a file takes one KMS call no matter how many secrets it has. This
+needs the cryptography package.
+"""
+import base64
+import os
+import threading
+
+from .awsutils import decrypt_data_key, generate_data_key, reencrypt_data_key
+
+
+NONCE_SIZE = 12
+
+
+def _aesgcm(key):
+    """Return an AES-GCM cipher for key."""
+    try:
+        # pylint: disable=import-outside-toplevel
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError as err:
+        raise ImportError(
+            "envelope encryption needs the cryptography package, "
+            "install it with `pip install psyml[envelope]`"
+        ) from err
+    return AESGCM(key)
+
+
+class Envelope:
+    """A data key used to encrypt all the secrets in a psyml file."""
+
+    def __init__(self, data_key, key=None):
+        self.data_key = data_key
+        self._key = key
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, key_arn=None):
+        """Create an envelope with a new data key."""
+        key, data_key = generate_data_key(key_arn)
+        return cls(data_key, key)
+
+    def __repr__(self):
+        return "<Envelope>"
+
+    def rewrap(self, key_arn=None):
+        """
+        Return this envelope with its data key re-encrypted with key_arn.
+
+        Secrets encrypted with this envelope stay valid with the new one.
+        """
+        return type(self)(reencrypt_data_key(self.data_key, key_arn), self._key)
+
+    @property
+    def key(self):
+        """Return the plaintext data key, decrypt it on first use."""
+        with self._lock:
+            if self._key is None:
+                self._key = decrypt_data_key(self.data_key)
+            return self._key
+
+    def encrypt(self, name, plaintext):
+        """Encrypt plain text, the parameter name is authenticated too."""
+        nonce = os.urandom(NONCE_SIZE)
+        encrypted = _aesgcm(self.key).encrypt(
+            nonce, plaintext.encode(), name.encode()
+        )
+        return base64.b64encode(nonce + encrypted).decode()
+
+    def decrypt(self, name, encrypted):
+        """Decrypt encrypted text of the parameter named name."""
+        data = base64.b64decode(encrypted)
+        return (
+            _aesgcm(self.key)
+            .decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], name.encode())
+            .decode()
+        )
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Parsed psyml files cached on disk between runs.
+
+When PSYML_CACHE_DIR is set, the content of every valid psyml file is
+saved there in marshal format, keyed by a hash of the file and the version
+of psyml. Running psyml again on the same file skips parsing the yaml and
+validating it. Files with plaintext secrets are never cached.
+"""
+import hashlib
+import marshal
+import os
+import tempfile
+
+from .settings import PSYML_CACHE_DIR
+from .version import __version__
+
+
+CACHE_SUBDIR = "parsed"
+
+
+def get(text):
+    """Return the cached content of a psyml file, None if not cached."""
+    path = _cache_path(text)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as fobj:
+            data = marshal.load(fobj)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def put(text, data):
+    """Cache the content of a valid psyml file, failures are not fatal."""
+    path = _cache_path(text)
+    if path is None or any(
+        param["type"] == "SecureString" for param in data["parameters"]
+    ):
+        return
+    try:
+        content = marshal.dumps(data)
+    except ValueError:
+        # Values yaml loads as dates and the like.
+        return
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), delete=False
+        ) as fobj:
+            fobj.write(content)
+        os.replace(fobj.name, path)
+    except OSError:
+        pass
+
+
+def _cache_path(text):
+    """Return where a psyml file is cached, None if caching is disabled."""
+    if not PSYML_CACHE_DIR:
+        return None
+    digest = hashlib.sha256(f"{__version__}\0{text}".encode()).hexdigest()
+    return os.path.join(PSYML_CACHE_DIR, CACHE_SUBDIR, digest)
@@ -1,188 +1,711 @@
 #!/usr/bin/env python3
 """Core models for psyml package."""
+import atexit
+import collections
+import collections.abc
+import functools
+import operator
 import shlex
-
-import boto3
-import yaml
-
-from .awsutils import decrypt_with_psyml, encrypt_with_psyml, get_psyml_key_arn
-
-
-class PSyml:
-    """Represents a PSyml file."""
-
-    def __init__(self, file):
+import sys
+
+from . import filecache
+from .awsutils import (
+    decrypt_with_psyml,
+    encrypt_with_psyml,
+    get_psyml_key_arn,
+    reencrypt_with_psyml,
+)
+from .cache import LRUCache
+from .clients import get_client
+from .concurrency import ordered_imap, parallel_map
+from .envelope import Envelope
+from .profiling import span
+from .remote import (
+    DELETE_BATCH_SIZE,
+    chunks,
+    describe_names,
+    describe_path,
+    fetch_parameters,
+    fetch_tags,
+)
+from .scheduler import get_scheduler
+from .settings import PSYML_DECRYPT_CACHE_SIZE
+from .state import open_state
+from .yamlutils import dump, load, stream_dump, stream_load
+
+
+Difference = collections.namedtuple("Difference", ["kind", "name"])
+
+# Schema of psyml files, field names mapped to their types.
+MANDANTORY_FIELDS = {
+    "path": str,
+    "region": (str, list),
+    "kmskey": str,
+    "parameters": (list, collections.abc.Iterator),
+}
+OPTIONAL_FIELDS = {"tags": dict, "encrypted_with": str, "data_key": str}
+PARAMETER_FIELDS = frozenset(["name", "description", "type", "value"])
+PARAMETER_STR_FIELDS = ("name", "description", "type")
+PARAMETER_TYPES = {
+    name: sys.intern(name)
+    for name in ["String", "SecureString", "string", "securestring"]
+}
+
+
+class ValidationError(AssertionError):
+    """
+    A psyml file is not valid.
+
+    errors lists all the problems found, the message has all of them.
+    """
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+# Decrypted values keyed by (name, ciphertext), shared by all parameters in
+# this process. Plaintext is only ever kept in memory.
+DECRYPTED_VALUES = LRUCache(PSYML_DECRYPT_CACHE_SIZE, intern=True)
+atexit.register(DECRYPTED_VALUES.clear)
+
+
+class PSyml:  # pylint: disable=too-many-instance-attributes
+    """
+    Represents a PSyml file.
+
+    If stream is set, parameters are parsed one at a time while a command
+    runs, so only encrypt, decrypt and refresh can be used, and the
+    `parameters` field has to be the last one in the file.
+    """
+
+    def __init__(self, file, jobs=None, output=None, stream=False):
+        self.jobs = jobs
+        self.output = output
+        self.stream = stream
         self.path = None
-        self.region = None
+        self.regions = None
         self.kmskey = None
         self.parameters = None
         self.tags = None
         self.encrypted_with = None
+        self.envelope = None
+        self._aws_tags = None
+
+        text = cached = None
+        with span("parse"):
+            if stream:
+                data = stream_load(file, "parameters")
+            else:
+                text = file.read()
+                cached = filecache.get(text)
+                data = load(text) if cached is None else cached
+        if cached is not None:
+            # Only valid files are cached.
+            self._load(cached)
+            return
+        with span("validate"):
+            self._validate(data)
+        if text is not None:
+            filecache.put(text, data)
+
+    def _validate(self, data):
+        """
+        Sanity check for the yaml.
 
-        self._validate(file.read())
-
-    def _validate(self, yaml_data):
-        """Sanity check for the yaml."""
-        data = yaml.safe_load(yaml_data)
-        assert isinstance(data, dict), "Invalid yml file"
+        All the problems in the file are reported in one ValidationError.
+        When streaming, problems in parameters are only reported while they
+        are parsed.
+        """
+        if not isinstance(data, dict):
+            raise ValidationError(["Invalid yml file"])
+
+        errors = []
+        if not data.keys() <= MANDANTORY_FIELDS.keys() | OPTIONAL_FIELDS.keys():
+            errors.append("Invalid key in yml file")
+        if not data.keys() >= MANDANTORY_FIELDS.keys():
+            errors.append("Missing mandantory field")
+        for fields in [MANDANTORY_FIELDS, OPTIONAL_FIELDS]:
+            for field, type_ in fields.items():
+                if field in data and not isinstance(data[field], type_):
+                    errors.append(f"field `{field}` has invalid type")
+
+        region = data.get("region")
+        if isinstance(region, list) and not (
+            region and all(isinstance(item, str) for item in region)
+        ):
+            errors.append("field `region` has invalid type")
+
+        parameters = data.get("parameters")
+        parameters = parameters if isinstance(parameters, list) else []
+        for index, param in enumerate(parameters):
+            errors.extend(
+                f"parameters[{index}]: {error}"
+                for error in Parameter.validate(param)
+            )
+        if errors:
+            raise ValidationError(errors)
+        self._load(data)
 
-        mandantory = {
-            "path": str,
-            "region": str,
-            "kmskey": str,
-            "parameters": list,
-        }
-        optional = {"tags": dict, "encrypted_with": str}
-        allowed = list(optional.keys()) + list(mandantory.keys())
-        for key in data:
-            assert key in allowed, "Invalid key in yml file"
-
-        for field in mandantory:
-            assert field in data, "Missing mandantory field"
-            assert isinstance(
-                data[field], mandantory[field]
-            ), f"field `{field}` has invalid type"
+    def _load(self, data):
+        """Set up this file from its valid content."""
+        region = data["region"]
         self.path = data["path"].rstrip("/") + "/"
-        self.region = data["region"]
+        self.regions = region if isinstance(region, list) else [region]
         self.kmskey = data["kmskey"]
-        self.parameters = [Parameter(param) for param in data["parameters"]]
-
-        for field in optional:
-            if field in data:
-                assert isinstance(
-                    data[field], optional[field]
-                ), f"field `{field}` has invalid type"
         self.tags = data.get("tags")
         self.encrypted_with = data.get("encrypted_with")
+        if "data_key" in data:
+            self.envelope = Envelope(data["data_key"])
+        if self.stream:
+            self.parameters = self._stream_parameters(data["parameters"])
+        else:
+            self.parameters = [
+                Parameter(param, self.envelope, validated=True)
+                for param in data["parameters"]
+            ]
+
+    def _stream_parameters(self, params):
+        """Yield Parameters of params, validating them one at a time."""
+        for index, param in enumerate(params):
+            errors = Parameter.validate(param)
+            if errors:
+                raise ValidationError(
+                    [f"parameters[{index}]: {error}" for error in errors]
+                )
+            yield Parameter(param, self.envelope, validated=True)
 
     def __repr__(self):
         return f"<PSyml: {self.path}>"
 
+    @property
+    def region(self):
+        """Return the region of this file, the first one if it has more."""
+        return self.regions[0] if self.regions else None
+
+    @property
+    def region_field(self):
+        """Return the `region` field of this file for yaml."""
+        return self.region if len(self.regions) == 1 else self.regions
+
+    @property
+    def tags(self):
+        """Return the tags of all the parameters in this file."""
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags):
+        self._tags = tags
+        self._aws_tags = None
+
     @property
     def aws_tags(self):
         """Return a list of AWS resouce Tags."""
         if self.tags is None:
             return None
-        return [
-            {"Key": key, "Value": self.tags[key]} for key in sorted(self.tags)
-        ]
+        if self._aws_tags is None:
+            self._aws_tags = [
+                {"Key": key, "Value": str(self.tags[key])}
+                for key in sorted(self.tags)
+            ]
+        return self._aws_tags
 
     ###############
     # Commands
     ###############
-    def encrypt(self):
-        """Encrypt a yml file with default kms key"""
+    def encrypt(self, envelope=False):
+        """
+        Encrypt a yml file with default kms key
+
+        If envelope is set, or the file is already using envelope encryption,
+        the values are encrypted locally with the data key of the file.
+        """
         if self.encrypted_with:
             encrypted_with = self.encrypted_with
         else:
             encrypted_with = get_psyml_key_arn()
         data = {
             "path": self.path,
-            "region": self.region,
+            "region": self.region_field,
             "kmskey": self.kmskey,
             "encrypted_with": encrypted_with,
         }
 
+        file_envelope = self.envelope
+        migrate = envelope and file_envelope is None
+        if migrate:
+            file_envelope = Envelope.create(encrypted_with)
+        if file_envelope is not None:
+            data["data_key"] = file_envelope.data_key
+
         if self.tags is not None:
             data["tags"] = self.tags
 
-        data["parameters"] = [param.encrypted for param in self.parameters]
-        print(yaml.dump(data, sort_keys=False, default_flow_style=False))
+        def encrypt(param):
+            if migrate and param.type_ == "securestring":
+                raise ValueError(
+                    "File has values encrypted without envelope, "
+                    "use `refresh --envelope` to migrate"
+                )
+            return param.encrypt(encrypted_with, file_envelope)
 
-    def save(self):
-        """Save items into Parameter store."""
-        for param in self.parameters:
-            SSMParameterStoreItem(self, param).save()
+        self._print_with_parameters(data, encrypt)
+
+    def save(self, state=None, regions=None):
+        """
+        Save items into Parameter store.
 
-    def nuke(self):
-        """Save remove all Parameter store items."""
+        New items are created with their tags, existing items only get tag
+        calls if their tags differ from the file. If state is given, the
+        state of the items written is recorded in that file.
+
+        Items are saved in every region of the file, or in regions if given.
+        Values are decrypted once, then all the regions are written
+        concurrently, each at its own rate. The result of each region is
+        printed, and a ValueError is raised if any of them failed.
+        """
+        regions = regions or self.regions
+        state = open_state(state) if state else None
+        # Decrypt first, so no write slot is held waiting for KMS.
+        parallel_map(
+            operator.attrgetter("decrypted_value"), self.parameters, self.jobs
+        )
+        self._in_regions(
+            "save", regions, lambda region: self._save_region(region, state)
+        )
+
+    def _in_regions(self, command, regions, func):
+        """
+        Run func(region) in every region concurrently.
+
+        func returns a summary of what it did, or None. The summary of each
+        region is printed, prefixed with the region if there are several,
+        and a ValueError is raised if any region failed.
+        """
+        if len(regions) == 1:
+            summary = func(regions[0])
+            if summary is not None:
+                print(f"{command}: {summary}", file=self.output)
+            return
+
+        def run(region):
+            try:
+                summary = func(region)
+            except Exception as err:  # pylint: disable=broad-except
+                return False, f"failed, {type(err).__name__}: {err}"
+            return True, "ok" if summary is None else summary
+
+        results = parallel_map(run, regions, len(regions))
+        for region, (_, summary) in zip(regions, results):
+            print(f"{command}: {region}: {summary}", file=self.output)
+        failed = [region for region, (ok, _) in zip(regions, results) if not ok]
+        if failed:
+            raise ValueError(
+                f"{command} failed in {len(failed)} of {len(regions)} "
+                f"regions: {', '.join(failed)}"
+            )
+
+    def _single_region(self, command):
+        """Raise a ValueError if the file has several regions."""
+        if len(self.regions) > 1:
+            raise ValueError(
+                f"{command} works on one region, the file has "
+                f"{len(self.regions)}: {', '.join(self.regions)}"
+            )
+
+    def _save_region(self, region, state=None):
+        """Save items into Parameter store in one region."""
+        ssm = get_client("ssm", region)
+        items = [
+            SSMParameterStoreItem(self, param, region)
+            for param in self.parameters
+        ]
+        existing = describe_names(ssm, [item.path for item in items], self.jobs)
+        current_tags = {}
+        if self.tags is not None:
+            current_tags = fetch_tags(ssm, list(existing), self.jobs)
+
+        # Throttling is per region, so is the write rate.
+        scheduler = get_scheduler(region)
+        scheduler.map(lambda item: item.put(item.path not in existing), items)
+        scheduler.map(
+            lambda item: item.tag(current_tags[item.path]),
+            [item for item in items if item.path in current_tags],
+        )
+        if state is not None:
+            self._record_state(state, region)
+
+    def _record_state(self, state, region=None):
+        """
+        Record the state of all parameters in parameter store of region,
+        after they were written.
+
+        Only the parameters that changed since they were last recorded are
+        decrypted.
+        """
+        region = region or self.region
+        ssm = get_client("ssm", region)
+        names = [self.path + param.name for param in self.parameters]
+        existing = describe_names(ssm, names, self.jobs)
+        stale = []
         for param in self.parameters:
-            SSMParameterStoreItem(self, param).delete()
+            name = self.path + param.name
+            entry = state.entry(region, name, existing.get(name))
+            if name in existing and not (entry and state.matches(entry, param)):
+                stale.append(param)
+        values = parallel_map(
+            operator.attrgetter("decrypted_value"), stale, self.jobs
+        )
+        for param, value in zip(stale, values):
+            name = self.path + param.name
+            state.record(region, name, param, value, existing[name])
+        state.forget(region, self.path, existing)
+        state.save()
+
+    def nuke(self, sweep=False, regions=None):
+        """
+        Save remove all Parameter store items.
+
+        Items are deleted in batches, items that are already gone are
+        ignored. If sweep is set, all the items under the path are removed,
+        including the ones not in the file. Items are removed from every
+        region of the file, or from regions if given, like in save.
+        """
+        self._in_regions(
+            "nuke",
+            regions or self.regions,
+            lambda region: self._nuke_region(region, sweep),
+        )
+
+    def _nuke_region(self, region, sweep=False):
+        """Remove Parameter store items in one region, return a summary."""
+        ssm = get_client("ssm", region)
+        names = [self.path + param.name for param in self.parameters]
+        if sweep:
+            names += sorted(set(describe_path(ssm, self.path)) - set(names))
+        results = get_scheduler(region).map(
+            lambda batch: ssm.delete_parameters(Names=batch),
+            chunks(names, DELETE_BATCH_SIZE),
+        )
+        deleted = sum(len(result["DeletedParameters"]) for result in results)
+        return f"{deleted} deleted, {len(names) - deleted} already gone"
 
     def decrypt(self):
         """Generate a yml file with all values decrypted."""
-        data = {"path": self.path, "region": self.region, "kmskey": self.kmskey}
+        data = {
+            "path": self.path,
+            "region": self.region_field,
+            "kmskey": self.kmskey,
+        }
 
         if self.tags is not None:
             data["tags"] = self.tags
 
-        data["parameters"] = [param.decrypted for param in self.parameters]
-        print(yaml.dump(data, sort_keys=False, default_flow_style=False))
+        self._print_with_parameters(data, operator.attrgetter("decrypted"))
+
+    def refresh(self, envelope=False):
+        """
+        Re-encrypt all values previously encrypte using an old key.
 
-    def refresh(self):
-        """Re-encrypt all values previously encrypte using an old key."""
-        if get_psyml_key_arn() == self.encrypted_with:
+        Values are re-encrypted by KMS without being decrypted here, and for
+        envelope encrypted files only the data key is. If envelope is set, a
+        file using one KMS call per value is migrated to envelope encryption
+        even if the key has not changed.
+        """
+        key_arn = get_psyml_key_arn(use_cache=False)
+        migrate = envelope and self.envelope is None
+        if key_arn == self.encrypted_with and not migrate:
             raise ValueError("PSYML key not refreshed, nothing to do")
 
         data = {
             "path": self.path,
-            "region": self.region,
+            "region": self.region_field,
             "kmskey": self.kmskey,
-            "encrypted_with": get_psyml_key_arn(),
+            "encrypted_with": key_arn,
         }
 
+        func = operator.methodcaller("re_encrypt", key_arn)
+        if migrate:
+            new_envelope = Envelope.create(key_arn)
+            func = operator.methodcaller("re_encrypt", key_arn, new_envelope)
+        elif self.envelope is not None:
+            # Values stay encrypted with the same data key.
+            new_envelope = self.envelope.rewrap(key_arn)
+            func = operator.methodcaller("encrypt", key_arn, new_envelope)
+        if migrate or self.envelope is not None:
+            data["data_key"] = new_envelope.data_key
+
         if self.tags is not None:
             data["tags"] = self.tags
 
-        data["parameters"] = [param.re_encrypted for param in self.parameters]
-        print(yaml.dump(data, sort_keys=False, default_flow_style=False))
+        self._print_with_parameters(data, func)
+
+    def _print_with_parameters(self, data, func):
+        """
+        Print data as yaml with func applied to every parameter as its
+        `parameters` field.
+
+        When streaming, each parameter is printed as soon as it is done, with
+        at most twice the number of jobs parameters in memory.
+        """
+        if self.stream:
+            data["parameters"] = ordered_imap(func, self.parameters, self.jobs)
+            stream_dump(data, "parameters", self.output)
+            return
+        data["parameters"] = parallel_map(func, self.parameters, self.jobs)
+        with span("emit"):
+            print(dump(data), file=self.output)
 
     def export(self):
         """
         Print bash export lines for all values that is ready to be sourced.
         """
+        parallel_map(
+            operator.attrgetter("decrypted_value"), self.parameters, self.jobs
+        )
         for parameter in self.parameters:
-            print(parameter.export)
+            print(parameter.export, file=self.output)
 
-    def diff(self):
+    def environment(self):
         """
-        Find missing ones
-        Find extra ones
-        Find value changes
-        Find tag changes
+        Return the decrypted values keyed by their environment variable name.
+
+        Values are decrypted concurrently, and named like in export.
         """
-        raise NotImplementedError
+        values = parallel_map(
+            operator.attrgetter("decrypted_value"), self.parameters, self.jobs
+        )
+        return {
+            param.env_name: value
+            for param, value in zip(self.parameters, values)
+        }
 
-    def sync(self):
-        """To be implemented."""
-        raise NotImplementedError
+    def diff(self, state=None):
+        """
+        Print differences between the yml file and parameter store.
 
+        If state is given, values unchanged since they were recorded in that
+        file are neither read nor decrypted.
+        """
+        self._single_region("diff")
+        state = open_state(state) if state else None
+        for difference in self.compare(state=state):
+            print(f"{difference.kind}: {difference.name}", file=self.output)
 
-class Parameter:
-    """Represents an parameter item in PSyml file."""
+    def fetch_remote(self, state=None):
+        """
+        Return the state of parameter store under the path of this file.
 
-    def __init__(self, param):
-        self.name = None
-        self.description = None
-        self.type_ = None
-        self.value = None
+        Values unchanged since they were recorded in state are not read.
+        """
+        known = None
+        if state is not None:
+            known = functools.partial(state.entry, self.region)
+        return fetch_parameters(
+            get_client("ssm", self.region),
+            self.path,
+            [self.path + param.name for param in self.parameters],
+            with_tags=self.tags is not None,
+            jobs=self.jobs,
+            known=known,
+        )
 
-        self._validate(param)
+    def _known_entries(self, remote, state):
+        """
+        Return the state entries of the parameters remote has no value for,
+        keyed by name.
 
-    def _validate(self, param):
-        """Sanity check for the parameter store item in yaml."""
-        assert isinstance(param, dict), "Invalid type for parameters"
+        Those without an entry were deleted after they were described,
+        before their value was read, they are removed from remote.
+        """
+        entries = {}
+        for param in self.parameters:
+            name = self.path + param.name
+            item = remote.get(name)
+            if item is None or "Value" in item:
+                continue
+            entry = None
+            if state is not None:
+                entry = state.entry(self.region, name, item)
+            if entry is None:
+                del remote[name]
+            else:
+                entries[param.name] = entry
+        return entries
+
+    def compare(self, remote=None, state=None):
+        """
+        Compare parameters with items in parameter store.
 
-        mandantory = ["name", "description", "type", "value"]
-        assert set(param.keys()) == set(
-            mandantory
-        ), "Invalid/missing parameter field"
+        Return a list of Differences, kind could be one of `missing`,
+        `extra`, `value`, `type`, `description` or `tags`. Tags are only
+        compared if the file has tags. remote is the result of fetch_remote,
+        it is fetched with state if not given. Values missing in remote are
+        compared with the ones recorded in state.
+        """
+        if remote is None:
+            remote = self.fetch_remote(state)
+        remote = dict(remote)
+        entries = self._known_entries(remote, state)
+        # Values with the same ciphertext as recorded need no decryption.
+        existing = [
+            param
+            for param in self.parameters
+            if self.path + param.name in remote
+            and not (
+                param.name in entries
+                and state.matches(entries[param.name], param)
+            )
+        ]
+        values = dict(
+            zip(
+                [param.name for param in existing],
+                parallel_map(
+                    operator.attrgetter("decrypted_value"), existing, self.jobs
+                ),
+            )
+        )
+        tags = {key: str(value) for key, value in (self.tags or {}).items()}
+
+        def changed(param, item):
+            if param.name not in values:
+                # Same ciphertext as recorded.
+                return False
+            if param.name in entries:
+                return not state.matches_value(
+                    entries[param.name], item["Name"], values[param.name]
+                )
+            return item.get("Value") != values[param.name]
+
+        differences = []
+        for param in self.parameters:
+            item = remote.pop(self.path + param.name, None)
+            if item is None:
+                differences.append(Difference("missing", param.name))
+                continue
+            if changed(param, item):
+                differences.append(Difference("value", param.name))
+            if item["Type"] != param.ssm_type:
+                differences.append(Difference("type", param.name))
+            if item.get("Description", "") != param.description:
+                differences.append(Difference("description", param.name))
+            if self.tags is not None and item["Tags"] != tags:
+                differences.append(Difference("tags", param.name))
+        for name in sorted(remote):
+            differences.append(Difference("extra", name[len(self.path) :]))
+        return differences
+
+    def sync(self, delete=False, state=None):
+        """
+        Update parameter store so it is in sync with the yml file.
 
-        for field in mandantory:
-            if field != "value":
-                assert isinstance(param[field], str), "Invalid parameter type"
+        Only parameters that differ are written, and tags are only written
+        for parameters whose tags differ. Parameters under the path that are
+        not in the file are deleted if delete is set. If state is given, it
+        is used like in diff, and updated once parameters are written.
+        """
+        self._single_region("sync")
+        params = {param.name: param for param in self.parameters}
+        state = open_state(state) if state else None
+        remote = self.fetch_remote(state)
+        plan = collections.defaultdict(set)
+        for difference in self.compare(remote, state):
+            plan[difference.name].add(difference.kind)
+
+        def apply(name):
+            kinds = plan[name]
+            if "extra" in kinds:
+                ssm = get_client("ssm", self.region)
+                scheduler.call(
+                    lambda: ssm.delete_parameter(Name=self.path + name)
+                )
+                return
+            item = SSMParameterStoreItem(self, params[name])
+            if "missing" in kinds:
+                scheduler.call(item.put, True)
+                return
+            if kinds & {"value", "type", "description"}:
+                scheduler.call(item.put)
+            if "tags" in kinds:
+                scheduler.call(item.tag, remote[item.path]["Tags"])
+
+        actions = [name for name in plan if delete or "extra" not in plan[name]]
+        # compare only decrypted the parameters that exist, decrypt the new
+        # ones first, so no write slot is held waiting for KMS.
+        parallel_map(
+            operator.attrgetter("decrypted_value"),
+            [params[name] for name in actions if "missing" in plan[name]],
+            self.jobs,
+        )
+        scheduler = get_scheduler(self.region)
+        parallel_map(apply, actions, self.jobs)
+
+        counts = collections.Counter()
+        for name in actions:
+            kinds = plan[name]
+            if "extra" in kinds:
+                counts["deleted"] += 1
+            elif "missing" in kinds:
+                counts["created"] += 1
+            else:
+                counts["updated"] += bool(
+                    kinds & {"value", "type", "description"}
+                )
+                counts["retagged"] += "tags" in kinds
+        # What save would have done: a put and a tag call per parameter.
+        skipped = len(self.parameters) * (1 if self.tags is None else 2) - (
+            counts["created"] + counts["updated"] + counts["retagged"]
+        )
+        print(
+            f"sync: {counts['created']} created, {counts['updated']} updated, "
+            f"{counts['retagged']} retagged, {counts['deleted']} deleted, "
+            f"{skipped} API calls skipped",
+            file=self.output,
+        )
+        if state is not None:
+            self._record_state(state)
+
+
+class Parameter:
+    """Represents an parameter item in PSyml file."""
 
-        assert param["type"] in [
-            "String",
-            "SecureString",
-            "string",
-            "securestring",
-        ], "Invalid type in parameter"
+    __slots__ = ("name", "description", "type_", "value", "envelope")
 
+    def __init__(self, param, envelope=None, validated=False):
+        if not validated:
+            errors = self.validate(param)
+            if errors:
+                raise ValidationError(errors)
         self.name = param["name"]
         self.description = param["description"]
-        self.type_ = param["type"]
+        self.type_ = PARAMETER_TYPES[param["type"]]
         self.value = str(param["value"])
+        self.envelope = envelope
+
+    @staticmethod
+    def validate(param):
+        """Return the problems of a parameter store item in yaml."""
+        if not isinstance(param, dict):
+            return ["Invalid type for parameters"]
+        if (
+            param.keys() == PARAMETER_FIELDS
+            and isinstance(param["name"], str)
+            and isinstance(param["description"], str)
+            and isinstance(param["type"], str)
+            and param["type"] in PARAMETER_TYPES
+        ):
+            return []
+        errors = []
+        if param.keys() != PARAMETER_FIELDS:
+            errors.append("Invalid/missing parameter field")
+        if not all(
+            isinstance(param.get(field, ""), str)
+            for field in PARAMETER_STR_FIELDS
+        ):
+            errors.append("Invalid parameter type")
+        elif param.get("type", "String") not in PARAMETER_TYPES:
+            errors.append("Invalid type in parameter")
+        return errors
 
     def __repr__(self):
         return f"<Parameter: {self.name}>"
@@ -190,8 +713,18 @@ class Parameter:
     @property
     def encrypted(self):
         """Retuen a dict for this parameter with value encrypted."""
-        if self.type_ == "SecureString":
-            value = encrypt_with_psyml(self.name, self.value)
+        return self.encrypt(envelope=self.envelope)
+
+    def encrypt(self, key_arn=None, envelope=None):
+        """
+        Return a dict for this parameter with value encrypted by key_arn.
+
+        If envelope is given, the value is encrypted locally with it instead.
+        """
+        if self.type_ == "SecureString" and envelope is not None:
+            value = envelope.encrypt(self.name, self.value)
+        elif self.type_ == "SecureString":
+            value = encrypt_with_psyml(self.name, self.value, key_arn)
         else:
             value = self.value
         return {
@@ -204,10 +737,23 @@ class Parameter:
     @property
     def re_encrypted(self):
         """Retuen a dict for this parameter with value encrypted."""
+        return self.re_encrypt(envelope=self.envelope)
+
+    def re_encrypt(self, key_arn=None, envelope=None):
+        """
+        Return a dict for this parameter with value re-encrypted.
+
+        If envelope is given, the value is encrypted locally with it instead,
+        otherwise an encrypted value is re-encrypted by KMS.
+        """
         if self.type_.lower() == "string":
             value = self.value
+        elif envelope is not None:
+            value = envelope.encrypt(self.name, self.decrypted_value)
+        elif self.type_ == "securestring" and self.envelope is None:
+            value = reencrypt_with_psyml(self.name, self.value, key_arn)
         else:
-            value = encrypt_with_psyml(self.name, self.decrypted_value)
+            value = encrypt_with_psyml(self.name, self.decrypted_value, key_arn)
         return {
             "name": self.name,
             "description": self.description,
@@ -218,37 +764,50 @@ class Parameter:
     @property
     def decrypted(self):
         """Retuen a dict for this parameter with value decrypted."""
-        types = {"securestring": "SecureString", "string": "String"}
         return {
             "name": self.name,
             "description": self.description,
             "value": self.decrypted_value,
-            "type": types.get(self.type_, self.type_),
+            "type": self.ssm_type,
         }
 
+    @property
+    def ssm_type(self):
+        """Return the type of this parameter in parameter store."""
+        types = {"securestring": "SecureString", "string": "String"}
+        return types.get(self.type_, self.type_)
+
     @property
     def decrypted_value(self):
         """Retuen decrypted value for this parameter."""
         if self.type_ == "securestring":
-            return decrypt_with_psyml(self.name, self.value)
+            if self.envelope is not None:
+                decrypt = self.envelope.decrypt
+            else:
+                decrypt = decrypt_with_psyml
+            return DECRYPTED_VALUES.get_or_compute(
+                (self.name, self.value), lambda: decrypt(self.name, self.value)
+            )
         return self.value
 
+    @property
+    def env_name(self):
+        """Return the name of the environment variable for this value."""
+        return self.name.replace("/", "_").replace("-", "_").upper()
+
     @property
     def export(self):
         """Return an export line for this value that can be source by bash."""
-        return (
-            f"export {self.name.replace('/', '_').replace('-', '_').upper()}"
-            f"={shlex.quote(self.decrypted_value)}"
-        )
+        return f"export {self.env_name}={shlex.quote(self.decrypted_value)}"
 
 
 class SSMParameterStoreItem:
     """An AWS SSM parameter store item."""
 
-    def __init__(self, psyml, param):
+    def __init__(self, psyml, param, region=None):
         self.psyml = psyml
         self.data = param
-        self.ssm = boto3.client("ssm", region_name=self.psyml.region)
+        self.ssm = get_client("ssm", region or self.psyml.region)
 
     @property
     def path(self):
@@ -261,21 +820,52 @@ class SSMParameterStoreItem:
 
     def save(self):
         """Save this item to parameter store."""
+        self.put()
+        self.tag()
+
+    def put(self, create=False):
+        """
+        Write the value of this item to parameter store.
+
+        A new item is created with its tags in the same call.
+        """
         kwargs = {
             "Name": self.path,
             "Description": self.data.description,
             "Value": self.data.decrypted_value,
-            "Type": self.data.type_,
-            "Overwrite": True,
+            "Type": self.data.ssm_type,
+            "Overwrite": not create,
         }
-        if self.data.type_ == "SecureString":
+        if self.data.ssm_type == "SecureString":
             kwargs["KeyId"] = self.psyml.kmskey
+        if create and self.psyml.aws_tags:
+            kwargs["Tags"] = self.psyml.aws_tags
         self.ssm.put_parameter(**kwargs)
-        if self.psyml.aws_tags is not None:
+
+    def tag(self, current=None):
+        """
+        Write tags of this item to parameter store.
+
+        If the current tags of this item are known, only the tags that
+        changed are written, and tags not in the file are removed.
+        """
+        if self.psyml.tags is None:
+            return
+        tags = self.psyml.aws_tags
+        if current is not None:
+            tags = [
+                tag for tag in tags if current.get(tag["Key"]) != tag["Value"]
+            ]
+            removed = sorted(set(current) - set(self.psyml.tags))
+            if removed:
+                self.ssm.remove_tags_from_resource(
+                    ResourceType="Parameter",
+                    ResourceId=self.path,
+                    TagKeys=removed,
+                )
+        if tags:
             self.ssm.add_tags_to_resource(
-                ResourceType="Parameter",
-                ResourceId=self.path,
-                Tags=self.psyml.aws_tags,
+                ResourceType="Parameter", ResourceId=self.path, Tags=tags
             )
 
     def delete(self):
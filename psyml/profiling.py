@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Wall clock spans of the phases of a psyml run.
+
+Spans are only recorded once enable() is called, otherwise span() costs
+next to nothing. AWS calls are recorded as spans by psyml.stats.
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+
+# When the import of psyml started.
+IMPORT_STARTED = time.perf_counter()
+
+_SPANS = []
+_LOCK = threading.Lock()
+_CONFIG = {"enabled": False}
+
+Span = collections.namedtuple("Span", ["name", "start", "end", "thread"])
+
+
+class _Timer:
+    """Context manager recording a span, when profiling is enabled."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if _CONFIG["enabled"]:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self.start is not None:
+            record(self.name, self.start, time.perf_counter())
+
+
+def enable():
+    """Start recording spans."""
+    _CONFIG["enabled"] = True
+
+
+def disable():
+    """Stop recording spans and forget the recorded ones."""
+    _CONFIG["enabled"] = False
+    with _LOCK:
+        _SPANS.clear()
+
+
+def span(name):
+    """Return a context manager recording how long its body takes."""
+    return _Timer(name)
+
+
+def record(name, start, end):
+    """Record a span that has already finished."""
+    if _CONFIG["enabled"]:
+        with _LOCK:
+            _SPANS.append(Span(name, start, end, threading.get_ident()))
+
+
+def spans():
+    """Return all the recorded spans."""
+    with _LOCK:
+        return list(_SPANS)
+
+
+def summary():
+    """
+    Return the total seconds and number of spans per phase.
+
+    AWS calls are grouped per service, e.g. `kms` and `ssm`. Calls made
+    concurrently are all counted, so the total can be more than the wall
+    time of the command.
+    """
+    phases = collections.OrderedDict()
+    for item in spans():
+        phase = item.name.split(".")[0]
+        seconds, count = phases.get(phase, (0.0, 0))
+        phases[phase] = (seconds + item.end - item.start, count + 1)
+    return phases
+
+
+def format_summary(phases):
+    """Format a summary as a table for humans."""
+    lines = [f"{'phase':<12} {'seconds':>8} {'spans':>6}"]
+    for phase, (seconds, count) in phases.items():
+        lines.append(f"{phase:<12} {seconds:>8.3f} {count:>6}")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path):
+    """
+    Save the spans in Chrome trace format.
+
+    The file can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+    events = [
+        {
+            "name": item.name,
+            "cat": item.name.split(".")[0],
+            "ph": "X",
+            "ts": (item.start - IMPORT_STARTED) * 1e6,
+            "dur": (item.end - item.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": item.thread,
+        }
+        for item in spans()
+    ]
+    with open(path, "w", encoding="UTF-8") as fobj:
+        json.dump({"traceEvents": events}, fobj)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Read parameters in parameter store in bulk."""
+import itertools
+
+from .awsutils import retry_on_throttling
+from .concurrency import parallel_map
+
+
+DESCRIBE_PAGE_SIZE = 50
+GET_BATCH_SIZE = 10
+DELETE_BATCH_SIZE = 10
+# Read values by name once the path holds this many times more parameters
+# than we are interested in, instead of reading the whole path.
+BY_NAME_RATIO = 2
+
+
+def chunks(items, size):
+    """Split items into lists of at most size items."""
+    items = list(items)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+@retry_on_throttling
+def call(method, **kwargs):
+    """Make an AWS call, retrying when throttled."""
+    return method(**kwargs)
+
+
+def paginate(method, result_key, **kwargs):
+    """Yield items in all the pages of a paginated AWS call."""
+    while True:
+        page = call(method, **kwargs)
+        yield from page[result_key]
+        if not page.get("NextToken"):
+            return
+        kwargs["NextToken"] = page["NextToken"]
+
+
+def describe_path(ssm, path):
+    """Return metadata of all parameters under path, keyed by full name."""
+    items = paginate(
+        ssm.describe_parameters,
+        "Parameters",
+        ParameterFilters=[
+            {"Key": "Name", "Option": "BeginsWith", "Values": [path]}
+        ],
+        MaxResults=DESCRIBE_PAGE_SIZE,
+    )
+    return {item["Name"]: item for item in items}
+
+
+def describe_names(ssm, names, jobs=None):
+    """Return metadata of the names that exist, keyed by full name."""
+    batches = parallel_map(
+        lambda batch: list(
+            paginate(
+                ssm.describe_parameters,
+                "Parameters",
+                ParameterFilters=[
+                    {"Key": "Name", "Option": "Equals", "Values": batch}
+                ],
+                MaxResults=DESCRIBE_PAGE_SIZE,
+            )
+        ),
+        chunks(names, DESCRIBE_PAGE_SIZE),
+        jobs,
+    )
+    return {item["Name"]: item for item in itertools.chain(*batches)}
+
+
+def fetch_values(ssm, path, names, path_size, jobs=None):
+    """
+    Return decrypted values of names under path, keyed by full name.
+
+    path_size is the number of parameters under path. If it is a lot larger
+    than the number of names, the names are read in concurrent batches,
+    otherwise the whole path is read page by page.
+    """
+    if not names:
+        return {}
+    if path_size > BY_NAME_RATIO * len(names):
+        batches = parallel_map(
+            lambda batch: call(
+                ssm.get_parameters, Names=batch, WithDecryption=True
+            )["Parameters"],
+            chunks(names, GET_BATCH_SIZE),
+            jobs,
+        )
+        items = itertools.chain.from_iterable(batches)
+    else:
+        items = paginate(
+            ssm.get_parameters_by_path,
+            "Parameters",
+            Path=path,
+            Recursive=True,
+            WithDecryption=True,
+            MaxResults=GET_BATCH_SIZE,
+        )
+    names = set(names)
+    return {
+        item["Name"]: item["Value"] for item in items if item["Name"] in names
+    }
+
+
+def fetch_tags(ssm, names, jobs=None):
+    """
+    Return tags of parameters as dicts, keyed by full name.
+
+    This is one ListTagsForResource call per parameter, parameter store has
+    no call reading the tags of several parameters.
+    """
+    tag_lists = parallel_map(
+        lambda name: call(
+            ssm.list_tags_for_resource,
+            ResourceType="Parameter",
+            ResourceId=name,
+        )["TagList"],
+        names,
+        jobs,
+    )
+    return {
+        name: {tag["Key"]: tag["Value"] for tag in tags}
+        for name, tags in zip(names, tag_lists)
+    }
+
+
+def fetch_parameters(
+    ssm, path, names, with_tags=False, jobs=None, *, known=None
+):  # pylint: disable=too-many-arguments
+    """
+    Return the state of parameters under path, keyed by full name.
+
+    Every parameter under path is included with its metadata as returned by
+    DescribeParameters. The ones in names also get a `Value`, unless
+    known(name, metadata) is true, and `Tags` if with_tags is set.
+    """
+    remote = describe_path(ssm, path)
+    existing = [name for name in names if name in remote]
+    unknown = [
+        name
+        for name in existing
+        if known is None or not known(name, remote[name])
+    ]
+    for name, value in fetch_values(
+        ssm, path, unknown, len(remote), jobs
+    ).items():
+        remote[name]["Value"] = value
+    if with_tags:
+        for name, tags in fetch_tags(ssm, existing, jobs).items():
+            remote[name]["Tags"] = tags
+    return remote
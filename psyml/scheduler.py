@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Adaptive scheduling of AWS write calls."""
+import os
+import threading
+
+from .awsutils import MAX_ATTEMPTS, backoff, is_retryable, is_throttling
+from .concurrency import TokenBucket, parallel_map
+from .settings import PSYML_JOBS, PSYML_MAX_WRITE_TPS
+
+
+# The default PutParameter quota is in the tens of calls per second.
+START_TPS = 40.0
+MIN_TPS = 1.0
+
+_SCHEDULERS = {}
+_LOCK = threading.Lock()
+_CONFIG = {"max_in_flight": PSYML_JOBS}
+
+
+def configure(max_in_flight):
+    """
+    Set how many writes can be in flight in a region, for all the files.
+
+    Schedulers created with another limit are dropped, so they are rebuilt
+    on next use.
+    """
+    with _LOCK:
+        if _CONFIG["max_in_flight"] != max_in_flight:
+            _CONFIG["max_in_flight"] = max_in_flight
+            _SCHEDULERS.clear()
+
+
+def get_scheduler(region):
+    """
+    Return the write scheduler of a region shared by everyone in this
+    process.
+
+    AWS throttles writes per account and region, so all the files written
+    concurrently share one scheduler per (region, credentials profile),
+    and together never have more than the configured number of writes in
+    flight there.
+    """
+    key = (region, os.environ.get("AWS_PROFILE"))
+    with _LOCK:
+        scheduler = _SCHEDULERS.get(key)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[key] = WriteScheduler(
+                _CONFIG["max_in_flight"]
+            )
+        return scheduler
+
+
+def reset():
+    """Drop all the schedulers."""
+    with _LOCK:
+        _SCHEDULERS.clear()
+
+
+class WriteScheduler:
+    """
+    Run AWS write calls concurrently, as fast as AWS accepts them.
+
+    Calls start with max_in_flight in flight at START_TPS, and the rate
+    about doubles every max_in_flight successful calls until a call is
+    throttled. From then on, the number of calls in flight and the rate
+    are halved when a call is throttled, and grow again slowly while calls
+    succeed. Neither goes above max_in_flight or max_tps. Throttled calls,
+    and calls that failed with a transient error, are retried after a
+    backoff.
+    """
+
+    def __init__(self, max_in_flight=None, max_tps=None):
+        self.max_in_flight = max_in_flight or PSYML_JOBS
+        self.max_tps = max_tps or PSYML_MAX_WRITE_TPS
+        self.limit = float(self.max_in_flight)
+        self.bucket = TokenBucket(min(START_TPS, self.max_tps))
+        self.throttled = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return (
+            f"<WriteScheduler: {int(self.limit)} in flight, "
+            f"{self.bucket.rate:.1f} tps>"
+        )
+
+    def map(self, func, items):
+        """Call func on every item, results are in the same order as items."""
+        return parallel_map(
+            lambda item: self.call(func, item), items, self.max_in_flight
+        )
+
+    def call(self, func, *args):
+        """Call func when there is room for it, retry if it failed."""
+        for attempt in range(MAX_ATTEMPTS):
+            with self._cond:
+                while self._in_flight >= int(self.limit):
+                    self._cond.wait()
+                self._in_flight += 1
+            try:
+                self.bucket.acquire()
+                result = func(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                if not is_retryable(err) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                if is_throttling(err):
+                    self._on_throttled()
+            else:
+                self._on_success()
+                return result
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+            backoff(attempt)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def _on_success(self):
+        """
+        Slow start until the first throttle, then additive increase, about
+        one more call in flight per round and one more tps per second.
+        """
+        with self._cond:
+            rate = self.bucket.rate
+            if not self.throttled:
+                rate += rate / self.max_in_flight
+            else:
+                self.limit = min(
+                    self.max_in_flight, self.limit + 1 / self.limit
+                )
+                rate += 1 / rate
+            self.bucket.rate = min(self.max_tps, rate)
+            self._cond.notify_all()
+
+    def _on_throttled(self):
+        """Multiplicative decrease."""
+        with self._cond:
+            self.throttled += 1
+            self.limit = max(1.0, self.limit / 2)
+            self.bucket.rate = max(MIN_TPS, self.bucket.rate / 2)
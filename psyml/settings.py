@@ -1,6 +1,16 @@
 #!/usr/bin/env python3
 """Global settings for psyml."""
+
 import os
 
 PSYML_KEY_REGION = os.environ.get("PSYML_KEY_REGION", "ap-southeast-2")
 PSYML_KEY_ALIAS = os.environ.get("PSYML_KEY_ALIAS", "alias/psyml")
+PSYML_JOBS = int(os.environ.get("PSYML_JOBS", "8"))
+PSYML_KEY_CACHE_TTL = float(os.environ.get("PSYML_KEY_CACHE_TTL", "3600"))
+PSYML_CACHE_DIR = os.environ.get("PSYML_CACHE_DIR", "")
+PSYML_DECRYPT_CACHE_SIZE = int(
+    os.environ.get("PSYML_DECRYPT_CACHE_SIZE", "10000")
+)
+PSYML_MAX_TPS = float(os.environ.get("PSYML_MAX_TPS", "0"))
+PSYML_MAX_WRITE_TPS = float(os.environ.get("PSYML_MAX_WRITE_TPS", "1000"))
+PSYML_LOAD_CACHE_TTL = float(os.environ.get("PSYML_LOAD_CACHE_TTL", "300"))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+State of parameter store as of the last `save` or `sync`.
+
+For each parameter, the state file records the `Version` and
+`LastModifiedDate` parameter store reported after it was written, a
+fingerprint of the value in the yml file and a keyed hash of the plaintext.
+While parameter store still reports the same version, the remote value is
+known without reading it, and while the yml file has the same ciphertext,
+the local value is known without decrypting it.
+
+The hash key is a data key of the psyml key, saved encrypted in the state
+file, so the file holds nothing that helps guessing a secret.
+"""
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+
+from .envelope import Envelope
+
+
+# States opened in this process, keyed by absolute path, so files saved
+# concurrently share one.
+_STATES = {}
+_LOCK = threading.Lock()
+
+
+def open_state(path):
+    """Return the state saved in path, an empty one if there is none."""
+    path = os.path.abspath(path)
+    with _LOCK:
+        if path not in _STATES:
+            _STATES[path] = State(path)
+        return _STATES[path]
+
+
+def fingerprint(param):
+    """
+    Return a fingerprint of the value of param as written in the yml file.
+
+    Plaintext secrets have none, they are only ever hashed with the key.
+    """
+    if param.type_ == "SecureString":
+        return None
+    return hashlib.sha256(f"{param.type_}\0{param.value}".encode()).hexdigest()
+
+
+class State:
+    """The state saved in a file, see open_state."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="UTF-8") as fobj:
+                data = json.load(fobj)
+        except FileNotFoundError:
+            data = {}
+        except ValueError as err:
+            raise ValueError(f"Invalid state file {path}: {err}") from err
+        self._envelope = None
+        if "state_key" in data:
+            self._envelope = Envelope(data["state_key"])
+        # Entries keyed by region, then by full parameter name.
+        self._regions = data.get("parameters", {})
+
+    def __repr__(self):
+        return f"<State: {self.path}>"
+
+    def entry(self, region, name, item):
+        """
+        Return the entry of a parameter, if item, its metadata from
+        DescribeParameters, shows it has not changed since it was recorded.
+        """
+        entry = self._regions.get(region, {}).get(name)
+        if entry is None or item is None:
+            return None
+        recorded = (entry["Version"], entry["LastModifiedDate"])
+        if recorded != (item["Version"], str(item["LastModifiedDate"])):
+            return None
+        return entry
+
+    @staticmethod
+    def matches(entry, param):
+        """Check whether param has the same ciphertext as recorded."""
+        recorded = entry["fingerprint"]
+        return recorded is not None and recorded == fingerprint(param)
+
+    def matches_value(self, entry, name, value):
+        """Check whether value is the plaintext recorded in entry."""
+        return hmac.compare_digest(entry["hmac"], self._hmac(name, value))
+
+    def record(self, region, name, param, value, item):
+        """Record a parameter just written, with its decrypted value."""
+        entry = {
+            "Version": item["Version"],
+            "LastModifiedDate": str(item["LastModifiedDate"]),
+            "fingerprint": fingerprint(param),
+            "hmac": self._hmac(name, value),
+        }
+        with self._lock:
+            self._regions.setdefault(region, {})[name] = entry
+
+    def forget(self, region, path, names):
+        """Forget the parameters under path that are not in names."""
+        names = set(names)
+        with self._lock:
+            entries = self._regions.get(region, {})
+            for name in list(entries):
+                if name.startswith(path) and name not in names:
+                    del entries[name]
+
+    def save(self):
+        """Write the state to its file."""
+        with self._lock:
+            data = {"parameters": self._regions}
+            if self._envelope is not None:
+                data["state_key"] = self._envelope.data_key
+            directory = os.path.dirname(self.path)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="UTF-8", dir=directory, delete=False
+            ) as fobj:
+                json.dump(data, fobj, indent=2, sort_keys=True)
+            os.replace(fobj.name, self.path)
+
+    def _hmac(self, name, value):
+        """Return the keyed hash of the plaintext of a parameter."""
+        with self._lock:
+            if self._envelope is None:
+                self._envelope = Envelope.create()
+        return hmac.new(
+            self._envelope.key, f"{name}\0{value}".encode(), hashlib.sha256
+        ).hexdigest()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Statistics of the AWS calls made by psyml.
+
+Every client from psyml.clients reports its calls here through botocore
+event hooks. Calls are counted per operation, e.g. `kms.Decrypt`, with
+their errors, throttled attempts, retries and a latency histogram.
+"""
+import bisect
+import json
+import threading
+import time
+
+from . import profiling
+
+
+THROTTLING_ERRORS = {
+    "LimitExceededException",
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_OPERATIONS = {}
+_LOCK = threading.Lock()
+_RETRY = threading.local()
+
+
+def instrument(client):
+    """Report the calls made by a boto3 client."""
+    service = client.meta.service_model.service_name
+    events = client.meta.events
+    # As specific as botocore.stub, so calls it answers are counted too.
+    events.register("before-call.*.*", _start)
+    events.register("response-received", _count_attempt)
+    events.register(
+        "after-call",
+        lambda context, parsed, **_: _finish(
+            service, context, parsed.get("Error", {}).get("Code")
+        ),
+    )
+    events.register(
+        "after-call-error",
+        lambda context, exception, **_: _finish(
+            service, context, type(exception).__name__
+        ),
+    )
+
+
+def snapshot():
+    """
+    Return the statistics of all the calls made so far.
+
+    This is a dict keyed by operation, each value has `calls`, `errors`,
+    `throttles`, `retries`, `seconds` and `latency`, which maps bucket upper
+    bounds in milliseconds(`inf` for the last one) to a number of calls.
+    """
+    with _LOCK:
+        return {
+            name: dict(
+                operation,
+                latency=dict(
+                    zip(
+                        [str(bound) for bound in LATENCY_BUCKETS] + ["inf"],
+                        operation["latency"],
+                    )
+                ),
+            )
+            for name, operation in sorted(_OPERATIONS.items())
+        }
+
+
+def reset():
+    """Forget all the calls made so far."""
+    with _LOCK:
+        _OPERATIONS.clear()
+
+
+def percentile(operation, fraction):
+    """
+    Return the latency under which fraction of the calls of an operation
+    completed, in milliseconds, as the upper bound of its bucket.
+    """
+    counts = list(operation["latency"].values())
+    target = fraction * sum(counts)
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+        seen += count
+        if count and seen >= target:
+            return bound
+    return 0
+
+
+def format_table(stats):
+    """Format a snapshot as a table for humans."""
+    lines = [
+        f"{'operation':<32} {'calls':>6} {'errors':>6} {'throttles':>9} "
+        f"{'retries':>7} {'p50 ms':>7} {'p99 ms':>7} {'total s':>8}"
+    ]
+    for name, operation in stats.items():
+        lines.append(
+            f"{name:<32} {operation['calls']:>6} {operation['errors']:>6} "
+            f"{operation['throttles']:>9} {operation['retries']:>7} "
+            f"{percentile(operation, 0.5):>7} "
+            f"{percentile(operation, 0.99):>7} "
+            f"{operation['seconds']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def format_json(stats):
+    """Format a snapshot as JSON."""
+    return json.dumps(stats, indent=2)
+
+
+def retrying():
+    """Count the next call made by this thread as a retry."""
+    _RETRY.pending = True
+
+
+def _start(model, context, **_):
+    """Remember when a call started."""
+    context["psyml_operation"] = model.name
+    context["psyml_started"] = time.perf_counter()
+    context["psyml_attempts"] = 0
+    context["psyml_throttles"] = 0
+    context["psyml_retry"] = getattr(_RETRY, "pending", False)
+    _RETRY.pending = False
+
+
+def _count_attempt(context, parsed_response=None, **_):
+    """Count an HTTP attempt of a call, and whether it was throttled."""
+    if "psyml_attempts" not in context:
+        return
+    context["psyml_attempts"] += 1
+    code = (parsed_response or {}).get("Error", {}).get("Code")
+    context["psyml_throttles"] += code in THROTTLING_ERRORS
+
+
+def _finish(service, context, error_code):
+    """Record a finished call."""
+    if "psyml_started" not in context:
+        return
+    started = context.pop("psyml_started")
+    ended = time.perf_counter()
+    seconds = ended - started
+    attempts = context.pop("psyml_attempts")
+    throttles = context.pop("psyml_throttles")
+    retried = context.pop("psyml_retry", False)
+    if not attempts and error_code in THROTTLING_ERRORS:
+        # botocore too old to report attempts.
+        throttles = 1
+    name = f"{service}.{context['psyml_operation']}"
+    profiling.record(name, started, ended)
+    with _LOCK:
+        stats = _OPERATIONS.get(name)
+        if stats is None:
+            stats = _OPERATIONS[name] = {
+                "calls": 0,
+                "errors": 0,
+                "throttles": 0,
+                "retries": 0,
+                "seconds": 0.0,
+                "latency": [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        stats["calls"] += 1
+        stats["errors"] += error_code is not None
+        stats["throttles"] += throttles
+        stats["retries"] += max(0, attempts - 1) + retried
+        stats["seconds"] += seconds
+        stats["latency"][
+            bisect.bisect_left(LATENCY_BUCKETS, seconds * 1000)
+        ] += 1
@@ -0,0 +1,3 @@
+#!/usr/bin/env python3
+"""Version of psyml."""
+__version__ = "0.2.2"
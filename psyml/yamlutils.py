@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+YAML loading and dumping for psyml.
+
+libyaml is used when PyYAML is built with it, the pure python
+implementation is used otherwise.
+"""
+import re
+
+import yaml
+
+
+LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+FAST_DUMPER = getattr(yaml, "CSafeDumper", None)  # pylint: disable=invalid-name
+# libyaml writes keys this long, or strings that need escaping, differently.
+FAST_KEY_LENGTH = 100
+PRINTABLE_ASCII = re.compile(r"[ -~]*")
+
+
+def load(yaml_data):
+    """Load a yaml document."""
+    return yaml.load(yaml_data, Loader=LOADER)
+
+
+def dump(data):
+    """
+    Dump data into a yaml document.
+
+    libyaml is only used if the output would be exactly the same as the
+    one from the pure python dumper.
+    """
+    options = {"sort_keys": False, "default_flow_style": False}
+    if FAST_DUMPER is not None and _is_plain(data):
+        return yaml.dump(data, Dumper=FAST_DUMPER, **options)
+    return yaml.dump(data, **options)
+
+
+def _is_plain(data):
+    """Check whether data only has printable ASCII strings and short keys."""
+    if isinstance(data, str):
+        return PRINTABLE_ASCII.fullmatch(data) is not None
+    if isinstance(data, dict):
+        return all(
+            isinstance(key, str)
+            and 0 < len(key) < FAST_KEY_LENGTH
+            and _is_plain(key)
+            and _is_plain(value)
+            for key, value in data.items()
+        )
+    if isinstance(data, list):
+        return all(_is_plain(item) for item in data)
+    return data is None or isinstance(data, (bool, int, float))
+
+
+def stream_load(stream, key):
+    """
+    Load a yaml mapping whose field `key`, a long list, is the last one.
+
+    The other fields are loaded when this is called. The list is returned
+    as an iterator in the mapping instead, its items are parsed one at a time
+    while it is consumed.
+    """
+    loader = LOADER(stream)
+    loader.get_event()
+    if not loader.check_event(yaml.DocumentStartEvent):
+        raise AssertionError("Invalid yml file")
+    loader.get_event()
+    if not loader.check_event(yaml.MappingStartEvent):
+        raise AssertionError("Invalid yml file")
+    loader.get_event()
+
+    anchors = {}
+    data = {}
+    while not loader.check_event(yaml.MappingEndEvent):
+        name = loader.construct_document(_compose_node(loader, anchors))
+        if name == key and loader.check_event(yaml.SequenceStartEvent):
+            loader.get_event()
+            data[name] = _stream_items(loader, anchors, key)
+            return data
+        data[name] = loader.construct_document(_compose_node(loader, anchors))
+    return data
+
+
+def _stream_items(loader, anchors, key):
+    """Yield the items of the list being parsed by loader."""
+    while not loader.check_event(yaml.SequenceEndEvent):
+        yield loader.construct_document(_compose_node(loader, anchors))
+    loader.get_event()
+    if not loader.check_event(yaml.MappingEndEvent):
+        raise AssertionError(f"field `{key}` must be the last one to stream")
+    loader.dispose()
+
+
+def _compose_node(loader, anchors):
+    """Compose the next node from parser events, like yaml.composer does."""
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None,
+                None,
+                f"found undefined alias {event.anchor}",
+                event.start_mark,
+            )
+        return anchors[event.anchor]
+
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(
+            tag, event.value, event.start_mark, event.end_mark, event.style
+        )
+        if event.anchor is not None:
+            anchors[event.anchor] = node
+        return node
+
+    if isinstance(event, yaml.SequenceStartEvent):
+        node_class, end_event = yaml.SequenceNode, yaml.SequenceEndEvent
+    else:
+        node_class, end_event = yaml.MappingNode, yaml.MappingEndEvent
+    tag = event.tag
+    if tag is None or tag == "!":
+        tag = loader.resolve(node_class, None, event.implicit)
+    node = node_class(tag, [], event.start_mark, None, event.flow_style)
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    while not loader.check_event(end_event):
+        if node_class is yaml.SequenceNode:
+            node.value.append(_compose_node(loader, anchors))
+        else:
+            node.value.append(
+                (_compose_node(loader, anchors), _compose_node(loader, anchors))
+            )
+    node.end_mark = loader.get_event().end_mark
+    return node
+
+
+def stream_dump(data, key, output=None):
+    """
+    Print data as a yaml document, its last field `key` being an iterable.
+
+    Each item is printed as soon as it is taken from the iterable. The
+    output is the same as `print(dump(data))`.
+    """
+    data = dict(data)
+    items = data.pop(key)
+    if data:
+        print(dump(data), end="", file=output)
+    empty = True
+    for item in items:
+        if empty:
+            print(f"{key}:", file=output)
+            empty = False
+        print(dump([item]), end="", file=output, flush=True)
+    if empty:
+        print(dump({key: []}), end="", file=output)
+    print(file=output)
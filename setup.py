@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
+import re
+
 from setuptools import setup, find_packages
 
 
-VERSION = "0.2.2"
+with open("psyml/version.py") as fobj:
+    VERSION = re.search(r'__version__ = "(.*)"', fobj.read()).group(1)
 
 
 with open("README.md") as fobj:
@@ -21,6 +24,7 @@ if __name__ == "__main__":
         long_description_content_type="text/markdown",
         packages=find_packages(),
         py_modules=["psyml"],
+        extras_require={"envelope": ["cryptography"]},
         entry_points={"console_scripts": ["psyml = psyml.__main__:main"]},
         classifiers=[
             "Development Status :: 4 - Beta",
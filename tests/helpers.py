@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+import psyml
+import psyml.models
+
+SECRETS_PSYML = {
+    "path": "/some-path",
+    "region": "us-west-1",
+    "kmskey": "some-kmskey",
+    "parameters": [
+        {
+            "name": f"name-{index}",
+            "description": "desc",
+            "type": "securestring",
+            "value": f"encrypted-{index}",
+        }
+        for index in range(5)
+    ],
+}
+
+
+class SecretsFileTestCase(unittest.TestCase):
+    """
+    Tests with SECRETS_PSYML saved at self.path, where `encrypted-N`
+    decrypts to `N` and the names decrypted are appended to self.decrypted.
+    """
+
+    def setUp(self):
+        self.decrypted = []
+
+        def de(name, value):
+            self.decrypted.append(name)
+            return value.split("-")[1]
+
+        patcher = mock.patch.object(psyml.models, "decrypt_with_psyml", de)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        psyml.models.DECRYPTED_VALUES.clear()
+        psyml.invalidate()
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "app.yml")
+        with open(self.path, "w") as fobj:
+            yaml.dump(SECRETS_PSYML, fobj)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import http.client
+import json
+import os
+import socket
+import stat
+import threading
+from unittest import mock
+
+import psyml.models
+from psyml import agent
+from tests.helpers import SecretsFileTestCase
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class TestAgent(SecretsFileTestCase):
+    def test_get(self):
+        local = agent.Agent([self.path], ttl=60)
+        self.assertEqual(
+            local.names(), [f"/some-path/name-{index}" for index in range(5)]
+        )
+        self.assertEqual(local.get("/some-path/name-1"), "1")
+        self.assertEqual(local.get("/some-path/name-1"), "1")
+        self.assertEqual(self.decrypted, ["name-1"])
+        with self.assertRaises(KeyError):
+            local.get("/some-path/missing")
+        with self.assertRaises(KeyError):
+            local.get("/other-path/name-1")
+        self.assertEqual(list(local._requested), ["/some-path/name-1"])
+
+    def test_refresh(self):
+        local = agent.Agent([self.path], ttl=60)
+        local.get("/some-path/name-0")
+        local.get("/some-path/name-1")
+        local.refresh()
+        self.assertEqual(len(self.decrypted), 2)
+
+        # Only values requested since they were fetched are refreshed.
+        psyml.models.DECRYPTED_VALUES.clear()
+        local._fetched = {name: -100 for name in local._fetched}
+        local._requested = {"/some-path/name-0": 0, "/some-path/name-1": -200}
+        local.refresh()
+        self.assertEqual(self.decrypted[2:], ["name-0"])
+
+    def test_refresh_failed(self):
+        local = agent.Agent([self.path], ttl=60)
+        local.get("/some-path/name-0")
+        local._fetched = {name: -100 for name in local._fetched}
+        local._requested["/some-path/name-0"] = 0
+        psyml.models.DECRYPTED_VALUES.clear()
+        with mock.patch.object(
+            psyml.models, "decrypt_with_psyml", side_effect=ValueError("kms")
+        ), mock.patch("sys.stderr") as stderr:
+            local.refresh()
+        self.assertTrue(stderr.write.called)
+        self.assertEqual(local.get("/some-path/name-0"), "0")
+
+    def test_server(self):
+        socket_path = os.path.join(self.tmpdir.name, "psyml.sock")
+        server = agent.make_server(agent.Agent([self.path]), socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.assertEqual(stat.S_IMODE(os.stat(socket_path).st_mode), 0o600)
+
+        def get(url):
+            connection = UnixHTTPConnection(socket_path)
+            connection.request("GET", url)
+            response = connection.getresponse()
+            body = response.read().decode()
+            connection.close()
+            return response.status, body
+
+        self.assertEqual(get("/health"), (200, "ok"))
+        self.assertEqual(get("/value?name=/some-path/name-2"), (200, "2"))
+        self.assertEqual(get("/value?name=/some-path/missing")[0], 404)
+        self.assertEqual(get("/nothing")[0], 404)
+        status, body = get("/names")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)), 5)
+
+    def test_socket_path_not_socket(self):
+        with self.assertRaises(FileExistsError):
+            agent.make_server(agent.Agent([self.path]), self.path)
+        self.assertTrue(os.path.isfile(self.path))
+
+    def test_socket_replaced(self):
+        socket_path = os.path.join(self.tmpdir.name, "psyml.sock")
+        agent.make_server(agent.Agent([self.path]), socket_path).server_close()
+        server = agent.make_server(agent.Agent([self.path]), socket_path)
+        server.server_close()
+        self.assertTrue(stat.S_ISSOCK(os.lstat(socket_path).st_mode))
+
+    def test_port_host_checked(self):
+        server = agent.make_server(agent.Agent([self.path]), port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        port = server.server_address[1]
+
+        def get(host):
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("GET", "/health", headers={"Host": host})
+            status = connection.getresponse().status
+            connection.close()
+            return status
+
+        self.assertEqual(get(f"127.0.0.1:{port}"), 200)
+        self.assertEqual(get(f"localhost:{port}"), 200)
+        self.assertEqual(get(f"attacker.example:{port}"), 403)
+        self.assertEqual(get("localhost"), 403)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+from unittest import mock
+
+import boto3
+from moto import mock_ssm
+
+import psyml
+from psyml import api, clients, stats
+from tests.helpers import SecretsFileTestCase
+
+
+class TestLoad(SecretsFileTestCase):
+    def test_lazy(self):
+        config = psyml.load(self.path)
+        self.assertEqual(len(config), 5)
+        self.assertEqual(sorted(config)[0], "name-0")
+        self.assertEqual(self.decrypted, [])
+        self.assertEqual(config["name-3"], "3")
+        self.assertEqual(config.get("name-3"), "3")
+        self.assertEqual(self.decrypted, ["name-3"])
+        self.assertNotIn("missing", config)
+        with self.assertRaises(KeyError):
+            config["missing"]
+
+        config.preload(jobs=2)
+        self.assertEqual(sorted(self.decrypted), sorted(config))
+        self.assertEqual(dict(config)["name-4"], "4")
+        self.assertEqual(repr(config), "<Parameters: 5 values>")
+
+    def test_cached(self):
+        config = psyml.load(self.path)
+        self.assertIs(psyml.load(self.path), config)
+
+        psyml.invalidate(self.path)
+        self.assertIsNot(psyml.load(self.path), config)
+
+    def test_file_changed(self):
+        config = psyml.load(self.path)
+        with open(self.path, "a") as fobj:
+            fobj.write("\n")
+        self.assertIsNot(psyml.load(self.path), config)
+
+    def test_expired(self):
+        config = psyml.load(self.path)
+        expired = mock.patch.object(api._LOADED, "_fresh", return_value=False)
+        with expired:
+            self.assertIsNot(psyml.load(self.path), config)
+
+    def test_bad_source(self):
+        with self.assertRaises(ValueError):
+            psyml.load(self.path, source="vault")
+
+    @mock_ssm
+    def test_ssm(self):
+        clients.reset()
+        stats.reset()
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        for index in range(5):
+            ssm.put_parameter(
+                Name=f"/app/name-{index}",
+                Value=f"value-{index}",
+                Type="SecureString",
+            )
+        ssm.put_parameter(Name="/app/nested/name", Value="v", Type="String")
+        ssm.put_parameter(Name="/application/name", Value="v", Type="String")
+
+        config = psyml.load("/app", source="ssm", region="us-west-1")
+        self.assertEqual(
+            sorted(config),
+            [f"name-{index}" for index in range(5)] + ["nested/name"],
+        )
+        self.assertEqual(config["name-2"], "value-2")
+        self.assertEqual(config["name-2"], "value-2")
+        self.assertEqual(stats.snapshot()["ssm.GetParameter"]["calls"], 1)
+        self.assertIs(
+            psyml.load("/app/", source="ssm", region="us-west-1"), config
+        )
+        psyml.invalidate("/app", source="ssm", region="us-west-1")
+        self.assertIsNot(
+            psyml.load("/app", source="ssm", region="us-west-1"), config
+        )
+        clients.reset()
@@ -1,19 +1,31 @@
 #!/usr/bin/env python3
+import json
 import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 import boto3
+from botocore.exceptions import ClientError, EndpointConnectionError
 from moto import mock_kms
 
 from psyml.awsutils import (
+    clear_key_arn_cache,
     decrypt_with_psyml,
     encrypt_with_psyml,
     get_psyml_key_arn,
+    reencrypt_with_psyml,
+    retry_on_throttling,
 )
+from psyml.clients import credentials_id
 from psyml.settings import PSYML_KEY_REGION, PSYML_KEY_ALIAS
 
 
 class TestAWSUtils(unittest.TestCase):
+    def setUp(self):
+        clear_key_arn_cache()
+
     @mock_kms
     def kms_setup(self):
         conn = boto3.client("kms", region_name=PSYML_KEY_REGION)
@@ -27,6 +39,62 @@ class TestAWSUtils(unittest.TestCase):
         self.kms_setup()
         self.assertEqual(get_psyml_key_arn(), self.key_arn)
 
+    @mock_kms
+    def test_get_psyml_key_arn_cached(self):
+        self.kms_setup()
+        with mock.patch(
+            "psyml.awsutils._describe_psyml_key", return_value=self.key_arn
+        ) as describe:
+            self.assertEqual(get_psyml_key_arn(), self.key_arn)
+            self.assertEqual(get_psyml_key_arn(), self.key_arn)
+            self.assertEqual(describe.call_count, 1)
+            self.assertEqual(get_psyml_key_arn(use_cache=False), self.key_arn)
+            self.assertEqual(describe.call_count, 2)
+
+    @mock.patch("psyml.awsutils.PSYML_KEY_CACHE_TTL", 10)
+    def test_get_psyml_key_arn_expired(self):
+        with mock.patch(
+            "psyml.awsutils._describe_psyml_key", return_value="arn"
+        ) as describe:
+            get_psyml_key_arn()
+            with mock.patch(
+                "psyml.awsutils.time.time", return_value=time.time() + 11
+            ):
+                get_psyml_key_arn()
+            self.assertEqual(describe.call_count, 2)
+
+    def test_get_psyml_key_arn_disk_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch(
+            "psyml.awsutils.PSYML_CACHE_DIR", cache_dir
+        ), mock.patch(
+            "psyml.awsutils._describe_psyml_key", return_value="arn"
+        ) as describe:
+            self.assertEqual(get_psyml_key_arn(), "arn")
+            clear_key_arn_cache()
+            self.assertEqual(get_psyml_key_arn(), "arn")
+            self.assertEqual(describe.call_count, 1)
+            with open(os.path.join(cache_dir, "keys.json")) as fobj:
+                self.assertEqual(
+                    list(json.load(fobj)),
+                    [
+                        f"{credentials_id()} {PSYML_KEY_REGION} {PSYML_KEY_ALIAS}"
+                    ],
+                )
+
+            # Another alias should not be served from the cache.
+            clear_key_arn_cache()
+            with mock.patch("psyml.awsutils.PSYML_KEY_ALIAS", "alias/other"):
+                get_psyml_key_arn()
+            self.assertEqual(describe.call_count, 2)
+
+            # Nor other credentials, which may be of another account.
+            clear_key_arn_cache()
+            with mock.patch(
+                "psyml.awsutils.credentials_id", return_value="other"
+            ):
+                get_psyml_key_arn()
+            self.assertEqual(describe.call_count, 3)
+
     @mock_kms
     def test_encrypt_decrypt(self):
         self.kms_setup()
@@ -37,3 +105,80 @@ class TestAWSUtils(unittest.TestCase):
 
         with self.assertRaises(self.conn.exceptions.InvalidCiphertextException):
             decrypt_with_psyml("another-name", encrypted)
+
+    @mock_kms
+    def test_reencrypt(self):
+        self.kms_setup()
+        encrypted = encrypt_with_psyml("some-name", "plaintext")
+        self.assertEqual(
+            reencrypt_with_psyml("some-name", encrypted), encrypted
+        )
+
+        new_key = self.conn.create_key()["KeyMetadata"]["Arn"]
+        reencrypted = reencrypt_with_psyml("some-name", encrypted, new_key)
+        self.assertNotEqual(reencrypted, encrypted)
+        self.assertEqual(
+            decrypt_with_psyml("some-name", reencrypted), "plaintext"
+        )
+
+
+class TestRetryOnThrottling(unittest.TestCase):
+    def client_error(self, code):
+        return ClientError({"Error": {"Code": code}}, "Decrypt")
+
+    @mock.patch("psyml.awsutils.time.sleep")
+    def test_retry_throttled(self, sleep):
+        calls = []
+
+        @retry_on_throttling
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise self.client_error("ThrottlingException")
+            return "done"
+
+        self.assertEqual(flaky(), "done")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @mock.patch("psyml.awsutils.time.sleep")
+    def test_no_retry_other_errors(self, sleep):
+        @retry_on_throttling
+        def broken():
+            raise self.client_error("AccessDeniedException")
+
+        with self.assertRaises(ClientError):
+            broken()
+        sleep.assert_not_called()
+
+    @mock.patch("psyml.awsutils.time.sleep")
+    def test_give_up(self, sleep):
+        @retry_on_throttling
+        def throttled():
+            raise self.client_error("ThrottlingException")
+
+        with self.assertRaises(ClientError):
+            throttled()
+        self.assertEqual(sleep.call_count, 7)
+
+    @mock.patch("psyml.awsutils.time.sleep")
+    def test_retry_transient(self, sleep):
+        errors = [
+            ClientError(
+                {
+                    "Error": {"Code": "InternalFailure"},
+                    "ResponseMetadata": {"HTTPStatusCode": 500},
+                },
+                "Decrypt",
+            ),
+            EndpointConnectionError(endpoint_url="https://kms"),
+        ]
+
+        @retry_on_throttling
+        def flaky():
+            if errors:
+                raise errors.pop(0)
+            return "done"
+
+        self.assertEqual(flaky(), "done")
+        self.assertEqual(sleep.call_count, 2)
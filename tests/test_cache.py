@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import threading
+import time
+import unittest
+from unittest import mock
+
+from psyml.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b", "gone"), "gone")
+        cache.pop("a")
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        self.assertEqual(cache.get_or_compute("a", lambda: 1), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_intern(self):
+        cache = LRUCache(3, intern=True)
+        first = "".join(["sec", "ret"])
+        second = "".join(["se", "cret"])
+        self.assertIsNot(first, second)
+        cache.put("a", first)
+        self.assertIs(cache.put("b", second), first)
+        self.assertIs(cache.get("b"), first)
+        cache.pop("a")
+        cache.pop("b")
+        self.assertEqual(cache._interned, {})
+
+    def test_get_or_compute_coalesced(self):
+        cache = LRUCache(10)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    cache.get_or_compute("key", compute)
+                )
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_or_compute("key", compute), "value")
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_error(self):
+        cache = LRUCache(10)
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_compute("key", fail)
+        self.assertNotIn("key", cache)
+        self.assertEqual(cache.get_or_compute("key", lambda: 1), 1)
+
+    def test_ttl(self):
+        cache = LRUCache(10, intern=True, ttl=60)
+        now = time.monotonic()
+        with mock.patch("psyml.cache.time.monotonic", return_value=now):
+            cache.put("a", "value")
+            self.assertEqual(cache.get("a"), "value")
+        with mock.patch("psyml.cache.time.monotonic", return_value=now + 61):
+            self.assertNotIn("a", cache)
+            self.assertEqual(cache.get_or_compute("a", lambda: "new"), "new")
+        self.assertEqual(cache._interned, {"new": ["new", 1]})
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from moto import mock_ssm
+
+from psyml import clients
+from psyml.settings import PSYML_JOBS
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        clients.reset()
+
+    def tearDown(self):
+        clients.reset()
+        clients.configure(max_pool_connections=PSYML_JOBS)
+
+    def test_client_reused(self):
+        ssm = clients.get_client("ssm", "us-west-1")
+        self.assertIs(clients.get_client("ssm", "us-west-1"), ssm)
+        self.assertIsNot(clients.get_client("ssm", "us-east-1"), ssm)
+        self.assertIsNot(clients.get_client("kms", "us-west-1"), ssm)
+        self.assertEqual(ssm.meta.region_name, "us-west-1")
+
+    def test_pool_size(self):
+        clients.configure(max_pool_connections=32)
+        ssm = clients.get_client("ssm", "us-west-1")
+        self.assertEqual(ssm.meta.config.max_pool_connections, 32)
+
+        clients.configure(max_pool_connections=32)
+        self.assertIs(clients.get_client("ssm", "us-west-1"), ssm)
+
+        clients.configure(max_pool_connections=4)
+        new_ssm = clients.get_client("ssm", "us-west-1")
+        self.assertIsNot(new_ssm, ssm)
+        self.assertEqual(new_ssm.meta.config.max_pool_connections, 4)
+
+    def test_credentials_id(self):
+        credentials_id = clients.credentials_id()
+        self.assertEqual(len(credentials_id), 16)
+        self.assertNotIn("testing", credentials_id)
+        clients.reset()
+        with mock.patch.dict("os.environ", {"AWS_ACCESS_KEY_ID": "other"}):
+            self.assertNotEqual(clients.credentials_id(), credentials_id)
+
+    def test_no_botocore_retries(self):
+        ssm = clients.get_client("ssm", "us-west-1")
+        self.assertEqual(ssm.meta.config.retries["total_max_attempts"], 1)
+
+    def test_rate_limit(self):
+        ssm = clients.get_client("ssm", "us-west-1")
+        acquired = []
+        with mock.patch(
+            "psyml.clients.TokenBucket.acquire",
+            lambda bucket: acquired.append(bucket.rate),
+        ), mock_ssm():
+            clients.set_rate_limit(5)
+            ssm.describe_parameters()
+            clients.set_rate_limit(None)
+            ssm.describe_parameters()
+        self.assertEqual(acquired, [5])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import threading
+import time
+import unittest
+
+from psyml.concurrency import TokenBucket, ordered_imap, parallel_map
+
+
+class TestParallelMap(unittest.TestCase):
+    def test_order_is_preserved(self):
+        def slow_double(value):
+            time.sleep(0.01 * (5 - value))
+            return value * 2
+
+        self.assertEqual(
+            parallel_map(slow_double, range(5), jobs=5), [0, 2, 4, 6, 8]
+        )
+
+    def test_bounded_workers(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(value)
+            return value
+
+        self.assertEqual(parallel_map(work, range(10), jobs=3), list(range(10)))
+        self.assertLessEqual(max(peak), 3)
+
+    def test_single_job(self):
+        threads = set()
+
+        def work(value):
+            threads.add(threading.current_thread())
+            return value
+
+        self.assertEqual(parallel_map(work, [1, 2, 3], jobs=1), [1, 2, 3])
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_exception_propagates(self):
+        def fail(value):
+            raise ValueError(value)
+
+        with self.assertRaises(ValueError):
+            parallel_map(fail, [1, 2], jobs=2)
+
+
+class TestOrderedImap(unittest.TestCase):
+    def test_order_is_preserved(self):
+        def slow_double(value):
+            time.sleep(0.01 * (5 - value))
+            return value * 2
+
+        self.assertEqual(
+            list(ordered_imap(slow_double, range(5), jobs=5)), [0, 2, 4, 6, 8]
+        )
+        self.assertEqual(list(ordered_imap(slow_double, [], jobs=5)), [])
+        self.assertEqual(list(ordered_imap(slow_double, [1], jobs=1)), [2])
+
+    def test_bounded_window(self):
+        taken = []
+
+        def items():
+            for value in range(100):
+                taken.append(value)
+                yield value
+
+        results = ordered_imap(lambda value: value, items(), jobs=2, window=4)
+        self.assertEqual(next(results), 0)
+        self.assertLessEqual(len(taken), 5)
+        self.assertEqual(list(results), list(range(1, 100)))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(100, burst=5)
+        start = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        # 5 tokens were saved up, the other 10 take 0.1s.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
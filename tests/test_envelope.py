@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+import boto3
+from cryptography.exceptions import InvalidTag
+from moto import mock_kms
+
+from psyml.awsutils import clear_key_arn_cache, decrypt_data_key
+from psyml.envelope import Envelope
+from psyml.settings import PSYML_KEY_REGION, PSYML_KEY_ALIAS
+
+
+@mock_kms
+class TestEnvelope(unittest.TestCase):
+    def setUp(self):
+        clear_key_arn_cache()
+        conn = boto3.client("kms", region_name=PSYML_KEY_REGION)
+        key = conn.create_key(Description="my key", KeyUsage="ENCRYPT_DECRYPT")
+        conn.create_alias(
+            AliasName=PSYML_KEY_ALIAS, TargetKeyId=key["KeyMetadata"]["Arn"]
+        )
+
+    def test_encrypt_decrypt(self):
+        envelope = Envelope.create()
+        encrypted = envelope.encrypt("some-name", "plaintext")
+        self.assertNotEqual(encrypted, "plaintext")
+        self.assertNotEqual(
+            envelope.encrypt("some-name", "plaintext"), encrypted
+        )
+        self.assertEqual(envelope.decrypt("some-name", encrypted), "plaintext")
+
+        with self.assertRaises(InvalidTag):
+            envelope.decrypt("another-name", encrypted)
+
+    def test_data_key_decrypted_once(self):
+        envelope = Envelope(Envelope.create().data_key)
+        with mock.patch(
+            "psyml.envelope.decrypt_data_key", wraps=decrypt_data_key
+        ) as decrypt:
+            encrypted = envelope.encrypt("a", "1")
+            self.assertEqual(envelope.decrypt("a", encrypted), "1")
+            self.assertEqual(envelope.decrypt("a", encrypted), "1")
+            self.assertEqual(decrypt.call_count, 1)
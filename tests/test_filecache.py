@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import copy
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from psyml import filecache
+from psyml.models import PSyml
+
+PSYML = {
+    "path": "/some-path",
+    "region": ["us-west-1", "us-east-1"],
+    "kmskey": "some-kmskey",
+    "tags": {"team": "a"},
+    "parameters": [
+        {
+            "name": "some-name",
+            "description": "some-desc",
+            "type": "String",
+            "value": 42,
+        },
+        {
+            "name": "secret",
+            "description": "secret-desc",
+            "type": "securestring",
+            "value": "encrypted-secret",
+        },
+    ],
+}
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        patcher = mock.patch.object(
+            filecache, "PSYML_CACHE_DIR", self.tmpdir.name
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cached(self):
+        directory = os.path.join(self.tmpdir.name, filecache.CACHE_SUBDIR)
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_cached(self):
+        text = yaml.dump(PSYML)
+        PSyml(io.StringIO(text))
+        self.assertEqual(len(self.cached()), 1)
+
+        with mock.patch("psyml.models.load", side_effect=AssertionError()):
+            psyml = PSyml(io.StringIO(text))
+        self.assertEqual(psyml.path, "/some-path/")
+        self.assertEqual(psyml.regions, ["us-west-1", "us-east-1"])
+        self.assertEqual(psyml.tags, {"team": "a"})
+        self.assertEqual(
+            [
+                (param.name, param.type_, param.value)
+                for param in psyml.parameters
+            ],
+            [
+                ("some-name", "String", "42"),
+                ("secret", "securestring", "encrypted-secret"),
+            ],
+        )
+
+        with mock.patch.object(filecache, "__version__", "0.0.1"):
+            self.assertIsNone(filecache.get(text))
+
+    def test_invalid_not_cached(self):
+        data = copy.deepcopy(PSYML)
+        data["region"] = 42
+        with self.assertRaises(AssertionError):
+            PSyml(io.StringIO(yaml.dump(data)))
+        self.assertEqual(self.cached(), [])
+
+    def test_plaintext_not_cached(self):
+        data = copy.deepcopy(PSYML)
+        data["parameters"][1]["type"] = "SecureString"
+        data["parameters"][1]["value"] = "plaintext"
+        PSyml(io.StringIO(yaml.dump(data)))
+        self.assertEqual(self.cached(), [])
+
+    def test_corrupted(self):
+        text = yaml.dump(PSYML)
+        filecache.put(text, PSYML)
+        path = os.path.join(
+            self.tmpdir.name, filecache.CACHE_SUBDIR, self.cached()[0]
+        )
+        with open(path, "wb") as fobj:
+            fobj.write(b"\x00")
+        self.assertIsNone(filecache.get(text))
+
+    def test_disabled(self):
+        text = yaml.dump(PSYML)
+        with mock.patch.object(filecache, "PSYML_CACHE_DIR", ""):
+            filecache.put(text, PSYML)
+            self.assertIsNone(filecache.get(text))
+        self.assertEqual(self.cached(), [])
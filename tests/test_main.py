@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+import yaml
+from moto import mock_ssm
+
+from psyml import profiling, stats
+from psyml.__main__ import (
+    environment,
+    expand_files,
+    main,
+    parse_args,
+    positive_float,
+    positive_int,
+    run_batch,
+    share_jobs,
+)
+
+PSYML = {
+    "path": "/some-path",
+    "region": "us-west-1",
+    "kmskey": "some-kmskey",
+    "parameters": [
+        {
+            "name": "some-name",
+            "description": "some-desc",
+            "type": "String",
+            "value": "some-value",
+        }
+    ],
+}
+
+
+class TestMain(unittest.TestCase):
+    def test_positive_int(self):
+        self.assertEqual(positive_int("3"), 3)
+        for value in ["0", "-1", "many"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                positive_int(value)
+
+    def test_positive_float(self):
+        self.assertEqual(positive_float("0.5"), 0.5)
+        for value in ["0", "-1", "many"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                positive_float(value)
+
+    def test_no_boto3_at_startup(self):
+        code = (
+            "import sys, psyml.__main__;"
+            "print(sorted({m.split('.')[0] for m in sys.modules}))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        ).stdout
+        self.assertNotIn("'boto3'", output)
+        self.assertNotIn("'botocore'", output)
+        # Only the agent needs http.server.
+        self.assertNotIn("'http'", output)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        for name in ["a.yml", "b.yaml", "c.txt"]:
+            with open(os.path.join(self.dir, name), "w") as fobj:
+                yaml.dump(PSYML, fobj)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_expand_files(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        b_yaml = os.path.join(self.dir, "b.yaml")
+        c_txt = os.path.join(self.dir, "c.txt")
+        self.assertEqual(expand_files([self.dir]), [a_yml, b_yaml])
+        self.assertEqual(expand_files([c_txt, a_yml]), [c_txt, a_yml])
+        self.assertEqual(
+            expand_files([os.path.join(self.dir, "*.y*ml")]), [a_yml, b_yaml]
+        )
+        with self.assertRaises(argparse.ArgumentTypeError):
+            expand_files([os.path.join(self.dir, "missing.yml")])
+
+    def test_run_batch(self):
+        broken = os.path.join(self.dir, "broken.yml")
+        with open(broken, "w") as fobj:
+            fobj.write("- not a psyml file")
+        files = expand_files([self.dir])
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            failures = run_batch(files, "decrypt", {}, 4)
+        self.assertEqual(failures, 1)
+        self.assertEqual(
+            err.getvalue().splitlines(),
+            [
+                f"{files[0]}: ok",
+                f"{files[1]}: ok",
+                f"{files[2]}: failed, ValidationError: Invalid yml file",
+            ],
+        )
+        documents = list(yaml.safe_load_all(out.getvalue()))
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0]["path"], "/some-path/")
+        self.assertIn(f"--- # {files[1]}", out.getvalue())
+
+    def test_share_jobs(self):
+        self.assertEqual(share_jobs(8, ["a.yml"]), (1, 8))
+        self.assertEqual(share_jobs(8, ["a.yml", "b.yml", "c.yml"]), (3, 2))
+        self.assertEqual(share_jobs(8, ["a.yml"] * 300), (8, 1))
+
+    def test_stream_single_file(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        self.assertTrue(parse_args(["decrypt", "--stream", a_yml]).stream)
+        with redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                parse_args(["decrypt", "--stream", self.dir])
+
+    def test_parse_run_args(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        args = parse_args(["run", a_yml, "--", "env", "--", "-i"])
+        self.assertEqual(args.file, [a_yml])
+        self.assertEqual(args.exec_args, ["env", "--", "-i"])
+
+        with redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                parse_args(["run", a_yml])
+            with self.assertRaises(SystemExit):
+                parse_args(["decrypt", a_yml, "--", "env"])
+
+    def test_parse_agent_args(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        args = parse_args(["agent", "--port", "8200", a_yml, "--ttl", "60"])
+        self.assertEqual(args.file, [a_yml])
+        self.assertEqual(args.paths, [])
+        self.assertEqual(args.ttl, 60)
+        args = parse_args(["agent", "--socket", "a.sock", "--path", "/app"])
+        self.assertEqual(args.file, [])
+        self.assertEqual(args.paths, ["/app"])
+
+        with redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                parse_args(["agent", "--socket", "a.sock"])
+            with self.assertRaises(SystemExit):
+                parse_args(["agent", a_yml])
+
+    def test_environment(self):
+        other = copy.deepcopy(PSYML)
+        other["parameters"][0]["value"] = "other-value"
+        other["parameters"].append(
+            {
+                "name": "path/other-name",
+                "description": "desc",
+                "type": "String",
+                "value": 42,
+            }
+        )
+        other_yml = os.path.join(self.dir, "other.yml")
+        with open(other_yml, "w") as fobj:
+            yaml.dump(other, fobj)
+
+        a_yml = os.path.join(self.dir, "a.yml")
+        with mock.patch.dict(os.environ, {"SOME_NAME": "x", "KEPT": "y"}):
+            env = environment([a_yml, other_yml], 2)
+        self.assertEqual(env["SOME_NAME"], "other-value")
+        self.assertEqual(env["PATH_OTHER_NAME"], "42")
+        self.assertEqual(env["KEPT"], "y")
+
+    def test_run(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        argv = ["psyml", "run", a_yml, "--", "printenv", "SOME_NAME"]
+        with mock.patch.object(sys, "argv", argv):
+            with mock.patch("os.execvpe") as execvpe:
+                main()
+        file, args, env = execvpe.call_args[0]
+        self.assertEqual((file, args), ("printenv", ["printenv", "SOME_NAME"]))
+        self.assertEqual(env["SOME_NAME"], "some-value")
+
+        argv[-2:] = ["/nonexistent/command"]
+        with mock.patch.object(sys, "argv", argv):
+            with self.assertRaises(SystemExit) as err:
+                main()
+        self.assertIn("/nonexistent/command", str(err.exception.code))
+
+    def test_profile(self):
+        self.addCleanup(profiling.disable)
+        a_yml = os.path.join(self.dir, "a.yml")
+        b_yaml = os.path.join(self.dir, "b.yaml")
+        with open(a_yml) as fobj:
+            content = fobj.read()
+
+        # The file after --profile is a psyml file, not the profile output.
+        argv = ["psyml", "decrypt", "--profile", a_yml, b_yaml]
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch.object(sys, "argv", argv):
+            with redirect_stdout(out), redirect_stderr(err):
+                main()
+        with open(a_yml) as fobj:
+            self.assertEqual(fobj.read(), content)
+        self.assertEqual(out.getvalue().count("--- # "), 2)
+        self.assertIn("command", err.getvalue())
+
+        trace = os.path.join(self.dir, "trace.json")
+        argv = ["psyml", "decrypt", "--profile-output", trace, a_yml]
+        with mock.patch.object(sys, "argv", argv):
+            with redirect_stdout(io.StringIO()), redirect_stderr(err):
+                main()
+        with open(trace) as fobj:
+            self.assertIn("traceEvents", json.load(fobj))
+
+        argv = ["psyml", "decrypt", "--profile-output", a_yml, a_yml]
+        with mock.patch.object(sys, "argv", argv):
+            with redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    main()
+        with open(a_yml) as fobj:
+            self.assertEqual(fobj.read(), content)
+
+    @mock_ssm
+    def test_stats(self):
+        a_yml = os.path.join(self.dir, "a.yml")
+        for argv, expected in [
+            (["--stats", a_yml], "operation"),
+            ([a_yml, "--stats"], "operation"),
+            (["--stats-format", "json", a_yml], "{"),
+        ]:
+            stats.reset()
+            err = io.StringIO()
+            with mock.patch.object(sys, "argv", ["psyml", "diff"] + argv):
+                with redirect_stdout(io.StringIO()), redirect_stderr(err):
+                    main()
+            self.assertTrue(err.getvalue().startswith(expected))
+            self.assertIn("ssm.DescribeParameters", err.getvalue())
+        json.loads(err.getvalue())
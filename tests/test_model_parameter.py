@@ -2,7 +2,7 @@
 import copy
 import unittest
 
-from psyml.models import Parameter
+from psyml.models import Parameter, ValidationError
 
 MINIMAL_PARAM = {
     "name": "some-name",
@@ -16,11 +16,14 @@ class TestParameter(unittest.TestCase):
     def setUp(self):
         """Monkey patch encrypt/decrypt methods to avoid KMS usage in tests."""
         de = lambda _, value: value.split("-")[1]
-        en = lambda name, value: f"{name}^{value}"
+        en = lambda name, value, key_arn=None: f"{name}^{value}"
+        re = lambda name, value, key_arn=None: en(name, de(name, value))
         import psyml.models
 
         psyml.models.encrypt_with_psyml = en
         psyml.models.decrypt_with_psyml = de
+        psyml.models.reencrypt_with_psyml = re
+        psyml.models.DECRYPTED_VALUES.clear()
 
     def test_minimal(self):
         param = Parameter(MINIMAL_PARAM)
@@ -65,6 +68,28 @@ class TestParameter(unittest.TestCase):
             Parameter(param)
         self.assertEqual(err.exception.args[0], "Invalid type in parameter")
 
+    def test_all_errors_reported(self):
+        param = copy.deepcopy(MINIMAL_PARAM)
+        del param["description"]
+        param["name"] = 3
+        with self.assertRaises(ValidationError) as err:
+            Parameter(param)
+        self.assertEqual(
+            err.exception.errors,
+            ["Invalid/missing parameter field", "Invalid parameter type"],
+        )
+        self.assertEqual(
+            err.exception.args[0],
+            "Invalid/missing parameter field; Invalid parameter type",
+        )
+        self.assertEqual(Parameter.validate(MINIMAL_PARAM), [])
+
+    def test_compact(self):
+        parameter = Parameter(MINIMAL_PARAM)
+        self.assertFalse(hasattr(parameter, "__dict__"))
+        with self.assertRaises(AttributeError):
+            parameter.extra = "foo"
+
     def test_value_type_conversion(self):
         param = copy.deepcopy(MINIMAL_PARAM)
         param["value"] = 3
@@ -91,6 +116,29 @@ class TestParameter(unittest.TestCase):
         parameter = Parameter(param)
         self.assertEqual(parameter.decrypted_value, "value")
 
+    def test_env_name(self):
+        param = copy.deepcopy(MINIMAL_PARAM)
+        param["name"] = "app/some-name"
+        self.assertEqual(Parameter(param).env_name, "APP_SOME_NAME")
+
+    def test_decrypted_value_cached(self):
+        import psyml.models
+
+        calls = []
+
+        def de(name, value):
+            calls.append(name)
+            return value.upper()
+
+        psyml.models.decrypt_with_psyml = de
+        param = copy.deepcopy(MINIMAL_PARAM)
+        param["type"] = "securestring"
+        first, second = Parameter(param), Parameter(param)
+        self.assertEqual(first.decrypted_value, "SOME-VALUE")
+        self.assertEqual(first.export, "export SOME_NAME=SOME-VALUE")
+        self.assertEqual(second.decrypted_value, "SOME-VALUE")
+        self.assertEqual(calls, ["some-name"])
+
     def test_encrypted(self):
         param = copy.deepcopy(MINIMAL_PARAM)
         parameter = Parameter(param)
@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 import copy
 import io
+import json
+import os
 import sys
+import tempfile
 import unittest
 from contextlib import contextmanager
+from unittest import mock
 
 import boto3
 import yaml
 from moto import mock_kms, mock_ssm
 
-from psyml.models import PSyml, Parameter
+import psyml.models as psyml_models
+from psyml import awsutils, remote, state
+from psyml.awsutils import clear_key_arn_cache
+from psyml.clients import get_client
+from psyml.models import PSyml, Parameter, ValidationError
+from psyml.scheduler import get_scheduler
 from psyml.settings import PSYML_KEY_REGION, PSYML_KEY_ALIAS
 
 
@@ -49,7 +58,6 @@ parameters:
 """
 
 # FIXME:
-# PSyml.refresh
 # PSyml.export
 
 
@@ -137,16 +145,70 @@ class TestPSyml(unittest.TestCase):
             psyml = PSyml(fobj)
         self.assertEqual(err.exception.args[0], "field `tags` has invalid type")
 
+        for regions in [[], ["us-west-1", 42]]:
+            bad_field_type = copy.deepcopy(MINIMAL_PSYML)
+            bad_field_type["region"] = regions
+            fobj = io.StringIO(yaml.dump(bad_field_type))
+            with self.assertRaises(AssertionError) as err:
+                psyml = PSyml(fobj)
+            self.assertEqual(
+                err.exception.args[0], "field `region` has invalid type"
+            )
+
+    def test_regions(self):
+        data = copy.deepcopy(MINIMAL_PSYML)
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        self.assertEqual(psyml.regions, ["us-west-1"])
+        self.assertEqual(psyml.region_field, "us-west-1")
+
+        data["region"] = ["us-west-1", "us-east-1"]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        self.assertEqual(psyml.region, "us-west-1")
+        self.assertEqual(psyml.region_field, ["us-west-1", "us-east-1"])
+
+    def test_validate_all_errors(self):
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["region"] = 42
+        data["parameters"].append({"name": "other"})
+        data["parameters"].append("not a parameter")
+        fobj = io.StringIO(yaml.dump(data))
+        with self.assertRaises(ValidationError) as err:
+            PSyml(fobj)
+        self.assertEqual(
+            err.exception.errors,
+            [
+                "field `region` has invalid type",
+                "parameters[1]: Invalid/missing parameter field",
+                "parameters[2]: Invalid type for parameters",
+            ],
+        )
+
+    def test_validate_stream(self):
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["parameters"].append({"name": "other"})
+        psyml = PSyml(
+            io.StringIO(yaml.dump(data, sort_keys=False)), stream=True
+        )
+        self.assertEqual(next(psyml.parameters).name, "some-name")
+        with self.assertRaises(ValidationError) as err:
+            next(psyml.parameters)
+        self.assertEqual(
+            err.exception.args[0],
+            "parameters[1]: Invalid/missing parameter field",
+        )
+
 
 class TestPSymlCommand(unittest.TestCase):
     def setUp(self):
         """Monkey patch encrypt/decrypt methods to avoid KMS usage in tests."""
         de = lambda _, value: value.split("-")[1]
-        en = lambda name, value: f"{name}^{value}"
+        en = lambda name, value, key_arn=None: f"{name}^{value}"
         import psyml.models
 
         psyml.models.encrypt_with_psyml = en
         psyml.models.decrypt_with_psyml = de
+        psyml.models.DECRYPTED_VALUES.clear()
+        clear_key_arn_cache()
 
     @mock_kms
     def kms_setup(self):
@@ -230,8 +292,563 @@ class TestPSymlCommand(unittest.TestCase):
         self.assertEqual(parameter["Value"], "some-value")
 
         # Test nuke
-        psyml.nuke()
+        with captured_output() as (out, err):
+            psyml.nuke()
+        self.assertEqual(out.getvalue(), "nuke: 1 deleted, 0 already gone\n")
         parameters = ssm.get_parameters_by_path(
             Path="some-path/", Recursive=False
         )["Parameters"]
         self.assertEqual(len(parameters), 0)
+
+    @mock_ssm
+    def test_save_regions(self):
+        regions = ["us-west-1", "us-east-1", "eu-west-1"]
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["region"] = regions[:2]
+        data["parameters"].append(
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "securestring",
+                "value": "encrypted-secret",
+            }
+        )
+        decrypt = mock.Mock(side_effect=lambda _, value: value.split("-")[1])
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        with mock.patch.object(
+            psyml_models, "decrypt_with_psyml", decrypt
+        ), captured_output() as (out, err):
+            psyml.save()
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ["save: us-west-1: ok", "save: us-east-1: ok"],
+        )
+        self.assertEqual(decrypt.call_count, 1)
+        for region in regions[:2]:
+            ssm = boto3.client("ssm", region_name=region)
+            secret = ssm.get_parameter(
+                Name="some-path/secret", WithDecryption=True
+            )["Parameter"]
+            self.assertEqual(secret["Value"], "secret")
+
+        save_region = psyml._save_region
+
+        def flaky(region, state=None):
+            if region == "us-east-1":
+                raise ValueError("down")
+            save_region(region, state)
+
+        with mock.patch.object(
+            psyml, "_save_region", flaky
+        ), captured_output() as (out, err):
+            with self.assertRaises(ValueError) as error:
+                psyml.save(regions=regions)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "save: us-west-1: ok",
+                "save: us-east-1: failed, ValueError: down",
+                "save: eu-west-1: ok",
+            ],
+        )
+        self.assertEqual(
+            str(error.exception), "save failed in 1 of 3 regions: us-east-1"
+        )
+        ssm = boto3.client("ssm", region_name="eu-west-1")
+        self.assertEqual(len(ssm.describe_parameters()["Parameters"]), 2)
+
+    @mock_ssm
+    def test_nuke_regions(self):
+        regions = ["us-west-1", "us-east-1", "eu-west-1"]
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["region"] = regions[:2]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        for region in regions:
+            boto3.client("ssm", region_name=region).put_parameter(
+                Name="some-path/some-name", Value="v", Type="String"
+            )
+
+        with captured_output() as (out, err):
+            psyml.nuke()
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "nuke: us-west-1: 1 deleted, 0 already gone",
+                "nuke: us-east-1: 1 deleted, 0 already gone",
+            ],
+        )
+        ssm = boto3.client("ssm", region_name="eu-west-1")
+        self.assertEqual(len(ssm.describe_parameters()["Parameters"]), 1)
+
+        with captured_output() as (out, err):
+            psyml.nuke(regions=["eu-west-1"])
+        self.assertEqual(out.getvalue(), "nuke: 1 deleted, 0 already gone\n")
+        self.assertEqual(len(ssm.describe_parameters()["Parameters"]), 0)
+
+    def test_one_region_commands(self):
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["region"] = ["us-west-1", "us-east-1"]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        for command in [psyml.diff, psyml.sync]:
+            with self.assertRaises(ValueError) as error:
+                command()
+            self.assertIn("us-west-1, us-east-1", str(error.exception))
+
+    @mock_kms
+    @mock_ssm
+    def test_diff(self):
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["path"] = "/some-path"
+        data["tags"] = {"team": "a"}
+        data["parameters"] += [
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "securestring",
+                "value": "encrypted-secret",
+            },
+            {
+                "name": "missing",
+                "description": "missing-desc",
+                "type": "String",
+                "value": "missing",
+            },
+        ]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        ssm.put_parameter(
+            Name="/some-path/some-name",
+            Description="some-desc",
+            Value="some-value",
+            Type="String",
+            Tags=[{"Key": "team", "Value": "a"}],
+        )
+        ssm.put_parameter(
+            Name="/some-path/secret",
+            Description="other-desc",
+            Value="old-secret",
+            Type="String",
+        )
+        ssm.put_parameter(Name="/some-path/extra", Value="v", Type="String")
+
+        with captured_output() as (out, err):
+            psyml.diff()
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "value: secret",
+                "type: secret",
+                "description: secret",
+                "tags: secret",
+                "missing: missing",
+                "extra: extra",
+            ],
+        )
+
+    @mock_kms
+    @mock_ssm
+    def test_sync(self):
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["path"] = "/some-path"
+        data["tags"] = {"team": "a"}
+        data["parameters"] += [
+            {
+                "name": "changed",
+                "description": "changed-desc",
+                "type": "String",
+                "value": "new-value",
+            },
+            {
+                "name": "missing",
+                "description": "missing-desc",
+                "type": "String",
+                "value": "missing",
+            },
+        ]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        ssm.put_parameter(
+            Name="/some-path/some-name",
+            Description="some-desc",
+            Value="some-value",
+            Type="String",
+            Tags=[{"Key": "team", "Value": "a"}],
+        )
+        ssm.put_parameter(
+            Name="/some-path/changed",
+            Description="changed-desc",
+            Value="old-value",
+            Type="String",
+        )
+        ssm.put_parameter(Name="/some-path/extra", Value="v", Type="String")
+
+        with captured_output() as (out, err):
+            psyml.sync()
+        self.assertEqual(
+            out.getvalue().strip(),
+            "sync: 1 created, 1 updated, 1 retagged, 0 deleted, "
+            "3 API calls skipped",
+        )
+        unchanged = ssm.get_parameter(Name="/some-path/some-name")
+        self.assertEqual(unchanged["Parameter"]["Version"], 1)
+        changed = ssm.get_parameter(Name="/some-path/changed")
+        self.assertEqual(changed["Parameter"]["Value"], "new-value")
+        tags = ssm.list_tags_for_resource(
+            ResourceType="Parameter", ResourceId="/some-path/missing"
+        )["TagList"]
+        self.assertEqual(tags, [{"Key": "team", "Value": "a"}])
+        self.assertEqual(psyml.compare(), [("extra", "extra")])
+
+        with captured_output() as (out, err):
+            psyml.sync(delete=True)
+        self.assertEqual(
+            out.getvalue().strip(),
+            "sync: 0 created, 0 updated, 0 retagged, 1 deleted, "
+            "6 API calls skipped",
+        )
+        self.assertEqual(psyml.compare(), [])
+
+    def test_compare_deleted_while_read(self):
+        psyml = PSyml(io.StringIO(yaml.dump(MINIMAL_PSYML)))
+        # Described, but deleted before its value was read.
+        remote = {
+            "some-path/some-name": {
+                "Name": "some-path/some-name",
+                "Type": "String",
+                "Description": "some-desc",
+                "Version": 1,
+                "LastModifiedDate": "2020-01-01",
+            }
+        }
+        stale = mock.Mock()
+        stale.entry.return_value = None
+        for recorded in [None, stale]:
+            self.assertEqual(
+                psyml.compare(remote, recorded), [("missing", "some-name")]
+            )
+
+    @mock_ssm
+    def test_sync_decrypts_before_writing(self):
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["parameters"] = [
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "securestring",
+                "value": "encrypted-secret",
+            }
+        ]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        psyml_models.DECRYPTED_VALUES.clear()
+        decrypted = []
+
+        def decrypt(name, value):
+            decrypted.append(name)
+            return "plaintext"
+
+        # New parameters are decrypted before any write slot is taken.
+        scheduler = get_scheduler("us-west-1")
+        call = scheduler.call
+
+        def checked_call(func, *args):
+            self.assertEqual(decrypted, ["secret"])
+            return call(func, *args)
+
+        with mock.patch.object(
+            psyml_models, "decrypt_with_psyml", decrypt
+        ), mock.patch.object(
+            scheduler, "call", checked_call
+        ), captured_output() as (
+            out,
+            err,
+        ):
+            psyml.sync()
+        self.assertIn("1 created", out.getvalue())
+
+    @mock_kms
+    @mock_ssm
+    def test_state(self):
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["path"] = "/some-path"
+        data["parameters"].append(
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "securestring",
+                "value": "encrypted-secret",
+            }
+        )
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "state.json")
+        PSyml(io.StringIO(yaml.dump(data))).save(state=path)
+        with open(path) as fobj:
+            saved = json.load(fobj)
+        self.assertIn("state_key", saved)
+        self.assertEqual(
+            sorted(saved["parameters"]["us-west-1"]),
+            ["/some-path/secret", "/some-path/some-name"],
+        )
+
+        def diff(data):
+            state._STATES.clear()
+            psyml_models.DECRYPTED_VALUES.clear()
+            decrypt = mock.Mock(
+                side_effect=lambda _, value: value.split("-")[1]
+            )
+            reads = mock.patch(
+                "psyml.remote.fetch_values", wraps=remote.fetch_values
+            )
+            with mock.patch.object(psyml_models, "decrypt_with_psyml", decrypt):
+                with reads as fetch, captured_output() as (out, err):
+                    PSyml(io.StringIO(yaml.dump(data))).diff(state=path)
+            read = fetch.call_args[0][2]
+            return out.getvalue().splitlines(), read, decrypt.call_count
+
+        # Nothing changed, no value is read or decrypted.
+        self.assertEqual(diff(data), ([], [], 0))
+
+        # Same plaintext with a new ciphertext.
+        data["parameters"][1]["value"] = "reencrypted-secret"
+        self.assertEqual(diff(data), ([], [], 1))
+        data["parameters"][1]["value"] = "encrypted-changed"
+        self.assertEqual(diff(data), (["value: secret"], [], 1))
+
+        # Changed in parameter store.
+        ssm.put_parameter(
+            Name="/some-path/some-name",
+            Value="other",
+            Type="String",
+            Overwrite=True,
+        )
+        self.assertEqual(
+            diff(data),
+            (
+                ["value: some-name", "value: secret"],
+                ["/some-path/some-name"],
+                1,
+            ),
+        )
+
+        with captured_output() as (out, err):
+            PSyml(io.StringIO(yaml.dump(data))).sync(state=path)
+        self.assertEqual(diff(data), ([], [], 0))
+
+    @mock_kms
+    def test_envelope(self):
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["parameters"].append(
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "SecureString",
+                "value": "plaintext",
+            }
+        )
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        with captured_output() as (out, err):
+            psyml.encrypt(envelope=True)
+        encrypted = PSyml(io.StringIO(out.getvalue()))
+        self.assertIsNotNone(encrypted.envelope)
+        secret = encrypted.parameters[1]
+        self.assertEqual(secret.type_, "securestring")
+        self.assertNotEqual(secret.value, "plaintext")
+        self.assertEqual(secret.decrypted_value, "plaintext")
+
+        # Per value encrypted files are migrated with refresh.
+        secret = copy.deepcopy(data["parameters"][1])
+        secret["type"] = "securestring"
+        secret["value"] = "encrypted-plaintext"
+        data["parameters"][1] = secret
+        data["encrypted_with"] = self.key_arn
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        with self.assertRaises(ValueError):
+            psyml.encrypt(envelope=True)
+        with self.assertRaises(ValueError):
+            psyml.refresh()
+        with captured_output() as (out, err):
+            psyml.refresh(envelope=True)
+        migrated = PSyml(io.StringIO(out.getvalue()))
+        self.assertIsNotNone(migrated.envelope)
+        self.assertEqual(migrated.parameters[1].decrypted_value, "plaintext")
+
+    @mock_kms
+    def test_refresh(self):
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["parameters"].append(
+            {
+                "name": "secret",
+                "description": "secret-desc",
+                "type": "SecureString",
+                "value": "plaintext",
+            }
+        )
+        kms = mock.patch.multiple(
+            "psyml.models",
+            encrypt_with_psyml=awsutils.encrypt_with_psyml,
+            reencrypt_with_psyml=awsutils.reencrypt_with_psyml,
+            decrypt_with_psyml=mock.Mock(side_effect=AssertionError()),
+        )
+
+        def rotate():
+            key_arn = self.conn.create_key()["KeyMetadata"]["Arn"]
+            self.conn.update_alias(
+                AliasName=PSYML_KEY_ALIAS, TargetKeyId=key_arn
+            )
+            return key_arn
+
+        for envelope in [False, True]:
+            with kms, captured_output() as (out, err):
+                PSyml(io.StringIO(yaml.dump(data))).encrypt(envelope=envelope)
+            encrypted = yaml.safe_load(out.getvalue())
+            key_arn = rotate()
+
+            # Values are never decrypted locally.
+            with kms, captured_output() as (out, err):
+                PSyml(io.StringIO(yaml.dump(encrypted))).refresh()
+            refreshed = yaml.safe_load(out.getvalue())
+            self.assertEqual(refreshed["encrypted_with"], key_arn)
+            secret = refreshed["parameters"][1]
+            if envelope:
+                self.assertNotEqual(
+                    refreshed["data_key"], encrypted["data_key"]
+                )
+                self.assertEqual(secret, encrypted["parameters"][1])
+                psyml = PSyml(io.StringIO(out.getvalue()))
+                self.assertEqual(
+                    psyml.envelope.decrypt("secret", secret["value"]),
+                    "plaintext",
+                )
+            else:
+                self.assertNotEqual(
+                    secret["value"], encrypted["parameters"][1]["value"]
+                )
+                self.assertEqual(
+                    awsutils.decrypt_with_psyml("secret", secret["value"]),
+                    "plaintext",
+                )
+
+    @mock_kms
+    def test_stream(self):
+        self.kms_setup()
+        data = {
+            "path": "some-path",
+            "region": "us-west-1",
+            "kmskey": "some-kmskey",
+            "tags": {"team": "a"},
+            "parameters": [
+                {
+                    "name": f"name-{index}",
+                    "description": "desc",
+                    "type": "SecureString" if index % 2 else "String",
+                    "value": f"value-{index}",
+                }
+                for index in range(20)
+            ],
+        }
+        yml = yaml.dump(data, sort_keys=False)
+
+        outputs = []
+        for stream in [False, True]:
+            output = io.StringIO()
+            psyml = PSyml(io.StringIO(yml), output=output, stream=stream)
+            psyml.encrypt()
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+        with self.assertRaises(AssertionError) as err:
+            data["tags"] = data.pop("tags")
+            yml = yaml.dump(data, sort_keys=False)
+            psyml = PSyml(io.StringIO(yml), stream=True)
+            with captured_output():
+                psyml.decrypt()
+        self.assertEqual(
+            err.exception.args[0],
+            "field `parameters` must be the last one to stream",
+        )
+
+    @mock_kms
+    @mock_ssm
+    def test_save_tags(self):
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["path"] = "/some-path"
+        data["tags"] = {"team": "a", "owner": "b"}
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        client = get_client("ssm", "us-west-1")
+
+        def tags():
+            return ssm.list_tags_for_resource(
+                ResourceType="Parameter", ResourceId="/some-path/some-name"
+            )["TagList"]
+
+        with mock.patch.object(
+            client, "add_tags_to_resource", wraps=client.add_tags_to_resource
+        ) as add_tags:
+            psyml.save()
+            self.assertEqual(
+                tags(),
+                [{"Key": "owner", "Value": "b"}, {"Key": "team", "Value": "a"}],
+            )
+            psyml.save()
+            add_tags.assert_not_called()
+
+            psyml.tags = {"team": "c"}
+            psyml.save()
+            add_tags.assert_called_once_with(
+                ResourceType="Parameter",
+                ResourceId="/some-path/some-name",
+                Tags=[{"Key": "team", "Value": "c"}],
+            )
+        self.assertEqual(tags(), [{"Key": "team", "Value": "c"}])
+
+    @mock_kms
+    @mock_ssm
+    def test_nuke_batches(self):
+        ssm = boto3.client("ssm", region_name="us-west-1")
+        self.kms_setup()
+        data = copy.deepcopy(MINIMAL_PSYML)
+        data["path"] = "/some-path"
+        data["parameters"] = [
+            {
+                "name": f"name-{index}",
+                "description": "desc",
+                "type": "String",
+                "value": "value",
+            }
+            for index in range(25)
+        ]
+        psyml = PSyml(io.StringIO(yaml.dump(data)))
+        for index in range(20):
+            ssm.put_parameter(
+                Name=f"/some-path/name-{index}", Value="v", Type="String"
+            )
+        ssm.put_parameter(Name="/some-path/extra", Value="v", Type="String")
+        ssm.put_parameter(Name="/other-path/name-1", Value="v", Type="String")
+        client = get_client("ssm", "us-west-1")
+
+        with mock.patch.object(
+            client, "delete_parameters", wraps=client.delete_parameters
+        ) as delete, captured_output() as (out, err):
+            psyml.nuke()
+            self.assertEqual(delete.call_count, 3)
+        self.assertEqual(out.getvalue(), "nuke: 20 deleted, 5 already gone\n")
+        remaining = ssm.describe_parameters()["Parameters"]
+        self.assertEqual(
+            sorted(param["Name"] for param in remaining),
+            ["/other-path/name-1", "/some-path/extra"],
+        )
+
+        with captured_output() as (out, err):
+            psyml.nuke(sweep=True)
+        self.assertEqual(out.getvalue(), "nuke: 1 deleted, 25 already gone\n")
+        remaining = ssm.describe_parameters()["Parameters"]
+        self.assertEqual(remaining[0]["Name"], "/other-path/name-1")
+        self.assertEqual(len(remaining), 1)
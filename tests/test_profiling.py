@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from psyml import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled(self):
+        with profiling.span("parse"):
+            pass
+        profiling.record("kms.Decrypt", 1.0, 2.0)
+        self.assertEqual(profiling.spans(), [])
+
+    def test_spans(self):
+        profiling.enable()
+        with profiling.span("parse"):
+            pass
+        profiling.record("kms.Decrypt", 1.0, 1.5)
+        profiling.record("kms.Encrypt", 2.0, 2.25)
+        with self.assertRaises(ValueError):
+            with profiling.span("command"):
+                raise ValueError()
+
+        spans = profiling.spans()
+        self.assertEqual(
+            [span.name for span in spans],
+            ["parse", "kms.Decrypt", "kms.Encrypt", "command"],
+        )
+        summary = profiling.summary()
+        self.assertEqual(list(summary), ["parse", "kms", "command"])
+        self.assertEqual(summary["kms"], (0.75, 2))
+        table = profiling.format_summary(summary).splitlines()
+        self.assertEqual(table[2].split(), ["kms", "0.750", "2"])
+
+    def test_chrome_trace(self):
+        profiling.enable()
+        profiling.record("kms.Decrypt", 1.0, 1.5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "trace.json")
+            profiling.write_chrome_trace(path)
+            with open(path) as fobj:
+                events = json.load(fobj)["traceEvents"]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["name"], "kms.Decrypt")
+        self.assertEqual(events[0]["cat"], "kms")
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertEqual(events[0]["dur"], 500000)
+
+    def test_imported_first(self):
+        modules = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, psyml; print(' '.join(sys.modules))",
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.split()
+        psyml_modules = [name for name in modules if name.startswith("psyml.")]
+        self.assertEqual(psyml_modules[0], "psyml.profiling")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+import boto3
+from moto import mock_ssm
+
+from psyml import remote
+from psyml.remote import chunks, fetch_parameters
+
+
+class TestChunks(unittest.TestCase):
+    def test_chunks(self):
+        self.assertEqual(chunks(range(5), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(chunks([], 10), [])
+
+
+@mock_ssm
+class TestFetchParameters(unittest.TestCase):
+    def setUp(self):
+        self.ssm = boto3.client("ssm", region_name="us-west-1")
+        for index in range(30):
+            self.ssm.put_parameter(
+                Name=f"/app/key-{index}",
+                Description=f"desc {index}",
+                Value=f"value-{index}",
+                Type="SecureString" if index % 2 else "String",
+            )
+        self.ssm.put_parameter(Name="/other/key", Value="other", Type="String")
+        self.ssm.add_tags_to_resource(
+            ResourceType="Parameter",
+            ResourceId="/app/key-1",
+            Tags=[{"Key": "team", "Value": "a"}],
+        )
+
+    def test_by_path(self):
+        names = [f"/app/key-{index}" for index in range(20)]
+        with mock.patch.object(
+            self.ssm, "get_parameters", side_effect=AssertionError
+        ):
+            params = fetch_parameters(self.ssm, "/app/", names)
+        self.assertEqual(len(params), 30)
+        self.assertNotIn("/other/key", params)
+        self.assertEqual(params["/app/key-1"]["Value"], "value-1")
+        self.assertEqual(params["/app/key-1"]["Type"], "SecureString")
+        self.assertEqual(params["/app/key-1"]["Description"], "desc 1")
+        self.assertNotIn("Value", params["/app/key-25"])
+
+    def test_by_name(self):
+        names = ["/app/key-1", "/app/key-2", "/app/missing"]
+        with mock.patch.object(
+            self.ssm, "get_parameters_by_path", side_effect=AssertionError
+        ):
+            params = fetch_parameters(
+                self.ssm, "/app/", names, with_tags=True, jobs=2
+            )
+        self.assertEqual(len(params), 30)
+        self.assertEqual(params["/app/key-2"]["Value"], "value-2")
+        self.assertEqual(params["/app/key-1"]["Tags"], {"team": "a"})
+        self.assertEqual(params["/app/key-2"]["Tags"], {})
+        self.assertNotIn("Tags", params["/app/key-3"])
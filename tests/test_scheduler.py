@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import threading
+import time
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from psyml import clients, scheduler as scheduler_module
+from psyml.scheduler import (
+    MIN_TPS,
+    START_TPS,
+    WriteScheduler,
+    get_scheduler,
+)
+from psyml.settings import PSYML_JOBS
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code}}, "PutParameter")
+
+
+@mock.patch("psyml.scheduler.backoff")
+class TestWriteScheduler(unittest.TestCase):
+    def test_slow_start(self, sleep):
+        scheduler = WriteScheduler(max_in_flight=4, max_tps=1000)
+        self.assertEqual(scheduler.limit, 4)
+        self.assertEqual(scheduler.bucket.rate, START_TPS)
+        results = scheduler.map(lambda value: value * 2, range(10))
+        self.assertEqual(results, [value * 2 for value in range(10)])
+        # 1.25 times the rate per call, about 2.4 times per round of 4.
+        self.assertAlmostEqual(scheduler.bucket.rate, START_TPS * 1.25 ** 10)
+        self.assertEqual(scheduler.throttled, 0)
+
+    def test_max_tps(self, sleep):
+        scheduler = WriteScheduler(max_in_flight=4, max_tps=50)
+        scheduler.map(lambda value: None, range(4))
+        self.assertEqual(scheduler.bucket.rate, 50)
+
+    def test_backs_off_when_throttled(self, sleep):
+        scheduler = WriteScheduler(max_in_flight=8)
+        scheduler.bucket.rate = 8
+        calls = []
+
+        def put():
+            calls.append(1)
+            if len(calls) <= 3:
+                raise client_error("ThrottlingException")
+            return "ok"
+
+        self.assertEqual(scheduler.call(put), "ok")
+        self.assertEqual(scheduler.throttled, 3)
+        self.assertEqual(sleep.call_count, 3)
+        # 8 -> 4 -> 2 -> 1, then one more call per round, one tps per second.
+        self.assertEqual(scheduler.limit, 2)
+        self.assertEqual(scheduler.bucket.rate, MIN_TPS + 1)
+
+        scheduler.call(lambda: None)
+        self.assertEqual(scheduler.limit, 2.5)
+
+    def test_retries_transient_errors(self, sleep):
+        scheduler = WriteScheduler(max_in_flight=8)
+        calls = []
+
+        def put():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ClientError(
+                    {
+                        "Error": {"Code": "InternalServerError"},
+                        "ResponseMetadata": {"HTTPStatusCode": 500},
+                    },
+                    "PutParameter",
+                )
+            return "ok"
+
+        self.assertEqual(scheduler.call(put), "ok")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(scheduler.throttled, 0)
+
+    def test_other_errors_raised(self, sleep):
+        scheduler = WriteScheduler()
+
+        def put():
+            raise client_error("ValidationException")
+
+        with self.assertRaises(ClientError):
+            scheduler.call(put)
+        sleep.assert_not_called()
+
+    def test_in_flight_bounded(self, sleep):
+        scheduler = WriteScheduler(max_in_flight=3, max_tps=1000)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def put(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            time.sleep(0.001)
+            with lock:
+                running.remove(value)
+
+        scheduler.map(put, range(40))
+        self.assertLessEqual(max(peak), 3)
+
+    def test_sees_client_throttles(self, sleep):
+        # Clients don't retry, so the scheduler sees every throttle.
+        ssm = clients.get_client("ssm", "us-west-1")
+        scheduler = WriteScheduler(max_in_flight=4)
+        with Stubber(ssm) as stubber:
+            stubber.add_client_error("delete_parameters", "ThrottlingException")
+            stubber.add_response(
+                "delete_parameters",
+                {"DeletedParameters": ["a"]},
+            )
+            result = scheduler.call(lambda: ssm.delete_parameters(Names=["a"]))
+            stubber.assert_no_pending_responses()
+        self.assertEqual(result["DeletedParameters"], ["a"])
+        self.assertEqual(scheduler.throttled, 1)
+        # Halved to 2 by the throttle, then grown by the success.
+        self.assertEqual(scheduler.limit, 2.5)
+
+
+class TestGetScheduler(unittest.TestCase):
+    def setUp(self):
+        scheduler_module.reset()
+        self.addCleanup(scheduler_module.reset)
+        self.addCleanup(scheduler_module.configure, PSYML_JOBS)
+
+    def test_shared_per_region(self):
+        scheduler = get_scheduler("us-west-1")
+        self.assertIs(get_scheduler("us-west-1"), scheduler)
+        self.assertIsNot(get_scheduler("us-east-1"), scheduler)
+        with mock.patch.dict("os.environ", {"AWS_PROFILE": "other"}):
+            self.assertIsNot(get_scheduler("us-west-1"), scheduler)
+
+        scheduler_module.configure(4)
+        new_scheduler = get_scheduler("us-west-1")
+        self.assertIsNot(new_scheduler, scheduler)
+        self.assertEqual(new_scheduler.max_in_flight, 4)
+
+    def test_in_flight_bounded_across_files(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def put(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            time.sleep(0.001)
+            with lock:
+                running.remove(value)
+
+        # Like files saved concurrently, each writing with 3 threads.
+        scheduler_module.configure(3)
+        threads = [
+            threading.Thread(
+                target=lambda: get_scheduler("us-west-1").map(put, range(30))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(peak), 120)
+        self.assertLessEqual(max(peak), 3)
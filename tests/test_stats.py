@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import json
+import unittest
+from unittest import mock
+
+from botocore.stub import Stubber
+from moto import mock_ssm
+
+from psyml import clients, stats
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        clients.reset()
+        stats.reset()
+
+    def tearDown(self):
+        clients.reset()
+        stats.reset()
+
+    @mock_ssm
+    def test_calls_counted(self):
+        ssm = clients.get_client("ssm", "us-west-1")
+        ssm.describe_parameters()
+        ssm.describe_parameters()
+        with self.assertRaises(ssm.exceptions.ParameterNotFound):
+            ssm.get_parameter(Name="missing")
+
+        snapshot = stats.snapshot()
+        self.assertEqual(
+            sorted(snapshot), ["ssm.DescribeParameters", "ssm.GetParameter"]
+        )
+        describe = snapshot["ssm.DescribeParameters"]
+        self.assertEqual(describe["calls"], 2)
+        self.assertEqual(describe["errors"], 0)
+        self.assertEqual(sum(describe["latency"].values()), 2)
+        self.assertEqual(snapshot["ssm.GetParameter"]["errors"], 1)
+
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_throttled(self):
+        ssm = clients.get_client("ssm", "us-west-1")
+        with Stubber(ssm) as stubber:
+            stubber.add_client_error(
+                "describe_parameters", "ThrottlingException"
+            )
+            with self.assertRaises(ssm.exceptions.ClientError):
+                ssm.describe_parameters()
+        describe = stats.snapshot()["ssm.DescribeParameters"]
+        self.assertEqual(describe["errors"], 1)
+        self.assertEqual(describe["throttles"], 1)
+
+    def test_retries(self):
+        context = {}
+        stats._start(model=mock.Mock(name="model"), context=context)
+        context["psyml_operation"] = "Decrypt"
+        throttled = {"Error": {"Code": "ThrottlingException"}}
+        stats._count_attempt(context, parsed_response=throttled)
+        stats._count_attempt(context, parsed_response={})
+        stats._finish("kms", context, None)
+
+        decrypt = stats.snapshot()["kms.Decrypt"]
+        self.assertEqual(decrypt["calls"], 1)
+        self.assertEqual(decrypt["retries"], 1)
+        self.assertEqual(decrypt["throttles"], 1)
+        self.assertEqual(decrypt["errors"], 0)
+
+    def test_retrying(self):
+        for retry in (False, True):
+            context = {}
+            if retry:
+                stats.retrying()
+            stats._start(model=mock.Mock(name="model"), context=context)
+            context["psyml_operation"] = "Decrypt"
+            stats._count_attempt(context, parsed_response={})
+            stats._finish("kms", context, None)
+
+        decrypt = stats.snapshot()["kms.Decrypt"]
+        self.assertEqual(decrypt["calls"], 2)
+        self.assertEqual(decrypt["retries"], 1)
+
+    def test_format(self):
+        operation = {
+            "calls": 4,
+            "errors": 0,
+            "throttles": 0,
+            "retries": 0,
+            "seconds": 0.1,
+            "latency": dict(
+                zip(
+                    [str(bound) for bound in stats.LATENCY_BUCKETS] + ["inf"],
+                    [0, 3, 0, 1] + [0] * 8,
+                )
+            ),
+        }
+        self.assertEqual(stats.percentile(operation, 0.5), 10)
+        self.assertEqual(stats.percentile(operation, 0.99), 50)
+
+        snapshot = {"kms.Decrypt": operation}
+        table = stats.format_table(snapshot).splitlines()
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table[1].split()[:2], ["kms.Decrypt", "4"])
+        self.assertEqual(json.loads(stats.format_json(snapshot)), snapshot)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import io
+import unittest
+from unittest import mock
+
+import yaml
+
+from psyml import yamlutils
+
+
+def pure_dump(data):
+    return yaml.dump(data, sort_keys=False, default_flow_style=False)
+
+
+DATA = {
+    "path": "/some-path/",
+    "region": "us-west-1",
+    "tags": {"team": "a", "count": 3},
+    "parameters": [
+        {
+            "name": "some-name",
+            "description": "it's a: long description " * 10,
+            "value": "AQECAHiuImqexTQGWMAtOjKMcH5UIxXuSZ5WSGx3WKO+VsUI3A==",
+            "type": "securestring",
+        }
+    ],
+}
+
+
+class TestYamlUtils(unittest.TestCase):
+    def test_load(self):
+        self.assertEqual(yamlutils.load(pure_dump(DATA)), DATA)
+
+    def test_dump_same_as_pure_python(self):
+        self.assertEqual(yamlutils.dump(DATA), pure_dump(DATA))
+
+        data = {"tags": {"k" * 127: "v"}, "value": "tab\tand é\n" * 20}
+        with mock.patch.object(
+            yamlutils.yaml, "dump", wraps=yamlutils.yaml.dump
+        ) as dump:
+            self.assertEqual(yamlutils.dump(data), pure_dump(data))
+            self.assertNotIn("Dumper", dump.call_args[1])
+
+    def test_is_plain(self):
+        self.assertTrue(yamlutils._is_plain(DATA))
+        self.assertFalse(yamlutils._is_plain({"a": "é"}))
+        self.assertFalse(yamlutils._is_plain({"a": "line\n"}))
+        self.assertFalse(yamlutils._is_plain({"": "a"}))
+        self.assertFalse(yamlutils._is_plain({1: "a"}))
+        self.assertFalse(yamlutils._is_plain({"a": object()}))
+
+    def test_fallback(self):
+        with mock.patch.object(yamlutils, "FAST_DUMPER", None):
+            self.assertEqual(yamlutils.dump(DATA), pure_dump(DATA))
+
+
+class TestStream(unittest.TestCase):
+    def test_stream_load(self):
+        data = yamlutils.stream_load(io.StringIO(pure_dump(DATA)), "parameters")
+        self.assertEqual(data["tags"], DATA["tags"])
+        self.assertEqual(list(data.pop("parameters")), DATA["parameters"])
+
+        yml = "a: &a {b: 1}\nitems:\n- *a\n- <<: *a\n  c: !!str 2\n"
+        data = yamlutils.stream_load(io.StringIO(yml), "items")
+        self.assertEqual(list(data["items"]), [{"b": 1}, {"b": 1, "c": "2"}])
+        data = yamlutils.stream_load(io.StringIO("items: 3\n"), "items")
+        self.assertEqual(data, {"items": 3})
+
+    def test_stream_load_errors(self):
+        for yml in ["", "- a\n", "items: []\na: 1\n"]:
+            with self.assertRaises(AssertionError):
+                data = yamlutils.stream_load(io.StringIO(yml), "items")
+                list(data["items"])
+
+    def test_stream_dump(self):
+        for data in [DATA, dict(DATA, parameters=[])]:
+            expected, output = io.StringIO(), io.StringIO()
+            print(yamlutils.dump(data), file=expected)
+            yamlutils.stream_dump(
+                dict(data, parameters=iter(data["parameters"])),
+                "parameters",
+                output,
+            )
+            self.assertEqual(output.getvalue(), expected.getvalue())